@@ -1,25 +1,86 @@
-from gemini_client import GeminiClient
-from database import Database
+from gemini_client import GeminiClient, get_default_gemini_client
+from database import Database, get_default_database
 from datetime import datetime, timedelta
-import json
+from typing import Optional
+from collections import OrderedDict
+import pandas as pd
+import threading
+import time
+
+# How long (seconds) an analysis result is reused for the same product
+ANALYSIS_CACHE_TTL = 60
+# Oldest analyses are evicted beyond this many (product, reference time) entries
+ANALYSIS_CACHE_SIZE = 256
+
+# Expiry window (days) and waste-rate band (%) where the pricing rules are not
+# decisive, so Gemini is asked to refine the decision
+AMBIGUOUS_EXPIRY_DAYS = (3, 5)
+AMBIGUOUS_WASTE_RATE_PCT = (12.0, 18.0)
 
 class PricingInventoryAgent:
     """Agent for pricing recommendations and inventory status (expiration tracking)"""
     
-    def __init__(self, gemini_client: GeminiClient = None):
-        self.gemini = gemini_client or GeminiClient()
-        self.db = Database()
+    def __init__(self, gemini_client: GeminiClient = None, db: Database = None):
+        self.gemini = gemini_client or get_default_gemini_client()
+        self.db = db or get_default_database()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
     
-    def analyze(self, product: str) -> dict:
+    def analyze(self, product: str, force_llm: bool = False, now: Optional[pd.Timestamp] = None) -> dict:
         """
         Analyze inventory status and pricing for a product.
+        Results are cached per product and reference time for ANALYSIS_CACHE_TTL seconds
+        (at most ANALYSIS_CACHE_SIZE entries).
+        
+        Args:
+            product: Product name
+            force_llm: Always ask Gemini, even when the pricing rules are decisive
+            now: Reference time for expiry math; pass one value when analyzing many products
         
         Returns:
             Dict with expiration status, discount recommendations, reasoning
         """
+        # Days to expiry depend on the reference time, so an explicit `now` gets its own entry
+        cache_key = (product, now)
+        
+        if not force_llm:
+            with self._cache_lock:
+                cached = self._cache.get(cache_key)
+                if cached is not None:
+                    if time.monotonic() - cached['timestamp'] < ANALYSIS_CACHE_TTL:
+                        return dict(cached['data'])
+                    del self._cache[cache_key]
+        
+        result = self._analyze_uncached(product, force_llm, now)
+        
+        if "error" not in result:
+            self._remember(cache_key, result)
+        
+        return result
+    
+    def _remember(self, cache_key: tuple, result: dict):
+        """Cache an analysis, dropping expired entries and evicting the oldest beyond ANALYSIS_CACHE_SIZE"""
+        now = time.monotonic()
+        with self._cache_lock:
+            self._cache[cache_key] = {'data': dict(result), 'timestamp': now}
+            self._cache.move_to_end(cache_key)
+            # Entries are in write order, so expired ones collect at the front
+            while self._cache:
+                oldest = next(iter(self._cache.values()))
+                if len(self._cache) <= ANALYSIS_CACHE_SIZE and now - oldest['timestamp'] < ANALYSIS_CACHE_TTL:
+                    break
+                self._cache.popitem(last=False)
+    
+    def clear_cache(self):
+        """Drop cached analyses, e.g. after inventory has been updated"""
+        with self._cache_lock:
+            self._cache = OrderedDict()
+    
+    def _analyze_uncached(self, product: str, force_llm: bool = False, now: Optional[pd.Timestamp] = None) -> dict:
+        """Run the full inventory and pricing analysis for a product"""
         
         # Get inventory data
-        inventory = self.db.get_inventory_status(product)
+        inventory = self.db.get_inventory_status(product, now)
         
         if "error" in inventory:
             return inventory
@@ -30,7 +91,37 @@ class PricingInventoryAgent:
         # Calculate urgency
         days_until_expiry = inventory['days_until_nearest_expiry']
         quantity_on_hand = inventory['total_quantity']
-
+        waste_rate = waste_stats.get('waste_rate_pct', 0)
+        
+        # Rule-based decision first; only pay for a Gemini call when it is borderline
+        decision = self._fallback_pricing_logic(days_until_expiry, quantity_on_hand, waste_stats)
+        if force_llm or self._is_ambiguous(days_until_expiry, waste_rate):
+            decision = self._llm_pricing_decision(product, inventory, waste_stats) or decision
+        
+        # Combine inventory data with pricing decision
+        return {
+            "product": product,
+            "quantity_on_hand": quantity_on_hand,
+            "days_until_expiry": days_until_expiry,
+            "expiration_date": inventory['nearest_expiration'],
+            "needs_discount": decision['needs_discount'],
+            "urgency": decision['urgency'],
+            "recommended_discount_pct": decision['recommended_discount_pct'],
+            "reasoning": decision['reasoning'],
+            "waste_rate_pct": waste_rate
+        }
+    
+    def _is_ambiguous(self, days_until_expiry: int, waste_rate: float) -> bool:
+        """Whether the pricing rules are too close to call without Gemini"""
+        low_days, high_days = AMBIGUOUS_EXPIRY_DAYS
+        low_waste, high_waste = AMBIGUOUS_WASTE_RATE_PCT
+        return low_days <= days_until_expiry <= high_days or low_waste <= waste_rate <= high_waste
+    
+    def _llm_pricing_decision(self, product: str, inventory: dict, waste_stats: dict) -> Optional[dict]:
+        """Ask Gemini for a pricing decision; returns None if the call fails"""
+        days_until_expiry = inventory['days_until_nearest_expiry']
+        quantity_on_hand = inventory['total_quantity']
+        
         # Decision logic with Gemini
         analysis_prompt = f"""You are analyzing inventory for a grocery store product.
 
@@ -73,24 +164,12 @@ class PricingInventoryAgent:
         )
         
         if "error" in decision:
-            # Fallback to rule-based
-            decision = self._fallback_pricing_logic(days_until_expiry, quantity_on_hand, waste_stats)
+            return None
         
-        # Combine inventory data with pricing decision
-        return {
-            "product": product,
-            "quantity_on_hand": quantity_on_hand,
-            "days_until_expiry": days_until_expiry,
-            "expiration_date": inventory['nearest_expiration_date'],
-            "needs_discount": decision['needs_discount'],
-            "urgency": decision['urgency'],
-            "recommended_discount_pct": decision['recommended_discount_pct'],
-            "reasoning": decision['reasoning'],
-            "waste_rate_pct": waste_stats.get('waste_rate_pct', 0)
-        }
+        return decision
     
-    def _fallback_pricing_logic(self, days_until_expiry, quantity, waste_stats):
-        """Simple rule-based fallback if Gemini fails"""
+    def _fallback_pricing_logic(self, days_until_expiry: int, quantity: int, waste_stats: dict) -> dict:
+        """Rule-based pricing decision, used directly when decisive and as fallback if Gemini fails"""
         if days_until_expiry <= 2:
             return {
                 "needs_discount": True,
@@ -1,13 +1,12 @@
-from gemini_client import GeminiClient
-from database import Database
-import json
+from gemini_client import GeminiClient, get_default_gemini_client, format_for_llm
+from database import Database, get_default_database
 
 class SupplierForecastAgent:
     """Agent for demand forecasting and supplier order recommendations"""
     
-    def __init__(self, gemini_client: GeminiClient = None):
-        self.gemini = gemini_client or GeminiClient()
-        self.db = Database()
+    def __init__(self, gemini_client: GeminiClient = None, db: Database = None):
+        self.gemini = gemini_client or get_default_gemini_client()
+        self.db = db or get_default_database()
     
     def forecast_and_order(self, product: str, days_ahead: int = 7) -> dict:
         """
@@ -44,7 +43,7 @@ class SupplierForecastAgent:
         Weather impact: {weather.get('interpretation', 'Unknown')}
 
         Daily breakdown:
-        {json.dumps(forecast['predictions'], indent=2)}
+        {format_for_llm(forecast['predictions'])}
 
         Generate a recommended order quantity considering safety stock (+10%).
         Explain the reasoning briefly."""
@@ -1,7 +1,62 @@
-from gemini_client import GeminiClient
-from database import Database
-from typing import Dict, List
-import json
+from gemini_client import GeminiClient, format_for_llm, get_default_gemini_client
+from database import Database, get_default_database
+from typing import Dict, Iterator, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import numpy as np
+import pandas as pd
+import re
+import time
+
+# Upper bound on concurrent data fetches per chatbot instance
+MAX_FETCH_WORKERS = 16
+
+# Forecast change vs. the historical weekly average (%) that triggers a supplier order analysis
+SUPPLIER_CHANGE_TRIGGER_PCT = 10
+
+# How often (seconds) the cached product catalog is refreshed
+PRODUCTS_REFRESH_SECONDS = 300
+
+# Most recent conversation turns sent to Gemini verbatim; older turns are
+# folded into a short running summary so prompt size stays bounded
+MAX_HISTORY_TURNS = 6
+
+# Greeting used when no product needs attention (no Gemini call needed)
+ALL_CLEAR_GREETING = "Good morning! All products are performing well today with low waste rates. How can I help you manage your inventory?"
+
+# Keywords that map a user question to the data it needs, so most messages
+# can be planned locally instead of with an extra Gemini call
+INTENT_KEYWORDS = {
+    "needs_current_status": ("today", "status", "current", "selling", "sold", "how is", "how are", "doing"),
+    "needs_forecast": ("forecast", "predict", "next week", "tomorrow", "expect", "demand", "order", "supplier"),
+    "needs_historical_trend": ("trend", "history", "historical", "past", "last week", "last month", "average"),
+    "needs_weather_analysis": ("weather", "rain", "temperature", "snow", "sunny", "cold", "hot day"),
+    "needs_discount_recommendation": ("discount", "price", "pricing", "markdown", "sale", "waste"),
+    "needs_inventory_status": ("inventory", "stock", "expir", "on hand", "shelf", "batch")
+}
+
+# Compiled once so per-message intent matching is a single regex scan per flag
+INTENT_PATTERNS = {
+    flag: re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE)
+    for flag, keywords in INTENT_KEYWORDS.items()
+}
+TIMEFRAME_PATTERN = re.compile(r"(\d+)\s*days?", re.IGNORECASE)
+
+def _product_key(name: str) -> str:
+    """Normalize a product name for matching ("hot dogs" -> "hotdogs")"""
+    return re.sub(r'[\s-]', '', name.lower())
+
+# Data fetchers keyed by data_needs flag:
+# (flag, result key, per-product Database method, batched Database method or None)
+_FETCHERS = (
+    ("needs_current_status", "current_status", Database.get_current_status, Database.get_current_status_many),
+    ("needs_forecast", "forecast", Database.get_prophet_prediction, Database.get_prophet_prediction_many),
+    ("needs_historical_trend", "historical_trend", Database.get_sales_trend, None),
+    ("needs_weather_analysis", "weather_impact", Database.get_weather_correlation, None),
+    ("needs_discount_recommendation", "discount_recommendation",
+     Database.get_discount_recommendation, Database.get_discount_recommendation_many),
+    ("needs_inventory_status", "inventory_status", Database.get_inventory_status, None)
+)
 
 class WasteLessChatbot:
     """
@@ -9,10 +64,13 @@ class WasteLessChatbot:
     Provides detailed, data-driven responses about inventory, waste, and ordering.
     """
     
-    def __init__(self):
-        self.gemini = GeminiClient()
-        self.db = Database()
-        self.conversation_history = []
+    def __init__(self, gemini_client: GeminiClient = None, db: Database = None):
+        self.gemini = gemini_client or get_default_gemini_client()
+        self.db = db or get_default_database()
+        self._executor = None
+        
+        # Product catalog and matcher used for local data-needs planning
+        self._refresh_products()
         
         # System instruction for Gemini
         self.system_instruction = """You are an AI assistant for WasteLess, a grocery store supply chain management system.
@@ -77,8 +135,79 @@ When answering:
             "data_needs": data_needed
         }
     
+    def handle_message_stream(self, user_message: str, session_data: Dict = None) -> Iterator[str]:
+        """
+        Handle a user message like handle_message, but yield the response
+        text in chunks as Gemini generates it.
+        """
+        data_needed = self._identify_data_needs(user_message)
+        gathered_data = self._gather_data(data_needed)
+        
+        yield from self.gemini.generate_text_stream(
+            user_prompt=self._build_response_context(user_message, gathered_data, session_data),
+            system_instruction=self.system_instruction,
+            temperature=0.7
+        )
+    
+    def _refresh_products(self):
+        """Reload the product catalog and everything derived from it"""
+        self._all_products = self.db.get_all_products()
+        self._products_joined = ", ".join(self._all_products)
+        self._product_pattern = self._build_product_pattern(self._all_products)
+        self._canonical_products = {_product_key(product): product for product in self._all_products}
+        self._all_products_refreshed = time.monotonic()
+    
+    def _products(self) -> List[str]:
+        """Cached product catalog, refreshed every PRODUCTS_REFRESH_SECONDS"""
+        if time.monotonic() - self._all_products_refreshed > PRODUCTS_REFRESH_SECONDS:
+            self._refresh_products()
+        return self._all_products
+    
+    @staticmethod
+    def _build_product_pattern(products: List[str]) -> re.Pattern:
+        """Compile a case-insensitive matcher for product names (longest names first)"""
+        alternatives = [
+            re.escape(product).replace(r'\-', r'[\s-]?')
+            for product in sorted(products, key=len, reverse=True)
+        ]
+        return re.compile(r"\b(" + "|".join(alternatives) + r")\b", re.IGNORECASE)
+    
+    def _match_data_needs(self, user_message: str) -> Optional[Dict]:
+        """
+        Plan data needs from keywords and product names in the message.
+        
+        Returns:
+            Dict in the same shape as the Gemini planner, or None if no intent matched
+        """
+        data_needs = {
+            flag: bool(pattern.search(user_message))
+            for flag, pattern in INTENT_PATTERNS.items()
+        }
+        
+        if not any(data_needs.values()):
+            return None
+        
+        # Map matched text back to canonical product names (refreshing a stale catalog first)
+        self._products()
+        products = []
+        for match in self._product_pattern.findall(user_message):
+            product = self._canonical_products.get(_product_key(match))
+            if product and product not in products:
+                products.append(product)
+        data_needs["products"] = products or ["all"]
+        
+        timeframe = TIMEFRAME_PATTERN.search(user_message)
+        if timeframe:
+            data_needs["timeframe_days"] = int(timeframe.group(1))
+        
+        return data_needs
+    
     def _identify_data_needs(self, user_message: str) -> Dict:
-        """Use Gemini to identify what data is needed to answer the question"""
+        """Identify what data is needed, using Gemini only when keywords don't match"""
+        
+        data_needs = self._match_data_needs(user_message)
+        if data_needs is not None:
+            return data_needs
         
         schema = {
             "type": "object",
@@ -125,7 +254,7 @@ When answering:
 
         User question: "{user_message}"
 
-        Available products: {', '.join(self.db.get_all_products())}
+        Available products: {self._products_joined}
 
         Determine what data we need to fetch."""
                 
@@ -153,71 +282,110 @@ When answering:
     def _gather_data(self, data_needs: Dict) -> Dict:
         """Gather all requested data from database"""
         
-        gathered = {}
         products = data_needs.get("products", ["all"])
         
         if "all" in products:
-            products = self.db.get_all_products()
-        
-        for product in products:
-            product_data = {"product": product}
-            
-            if data_needs.get("needs_current_status"):
-                product_data["current_status"] = self.db.get_current_status(product)
-            
-            if data_needs.get("needs_forecast"):
-                forecast_data = self.db.get_prophet_prediction(
-                    product, 
-                    days_ahead=data_needs.get("timeframe_days", 7)
-                )
-                product_data["forecast"] = forecast_data
-                
-                # Check if we should trigger supplier communication
-                if "error" not in forecast_data:
-                    supplier_action = self._analyze_forecast_for_supplier_action(product, forecast_data)
-                    if supplier_action["should_contact"]:
-                        product_data["supplier_communication"] = supplier_action
-            
-            if data_needs.get("needs_historical_trend"):
-                product_data["historical_trend"] = self.db.get_sales_trend(
-                    product,
-                    days=data_needs.get("timeframe_days", 30)
-                )
-            
-            if data_needs.get("needs_weather_analysis"):
-                product_data["weather_impact"] = self.db.get_weather_correlation(product)
-            
-            if data_needs.get("needs_discount_recommendation"):
-                product_data["discount_recommendation"] = self.db.get_discount_recommendation(product)
-            
-            if data_needs.get("needs_inventory_status"):
-                product_data["inventory_status"] = self.db.get_inventory_status(product)
-            
-            gathered[product] = product_data
+            products = self._products()
+        
+        # One reference time for every date/expiry calculation in this request
+        now = pd.Timestamp.now()
+        
+        # Per-request arguments for each data type, resolved once
+        timeframe_days = data_needs.get("timeframe_days")
+        fetch_kwargs = {
+            "current_status": {"date": now.date()},
+            "forecast": {"days_ahead": timeframe_days or 7},
+            "historical_trend": {"days": timeframe_days or 30},
+            "inventory_status": {"now": now}
+        }
+        
+        # Data types with a batched DB method are fetched for all products in one
+        # call; everything else gets one (product, key, fetch) task per product
+        batched = len(products) > 1
+        batch_tasks = []
+        tasks = []
+        for flag, key, fetch_one, fetch_many in _FETCHERS:
+            if not data_needs.get(flag):
+                continue
+            kwargs = fetch_kwargs.get(key, {})
+            if batched and fetch_many is not None:
+                batch_tasks.append((key, partial(fetch_many, self.db, products, **kwargs)))
+            else:
+                tasks.extend((product, key, partial(fetch_one, self.db, product, **kwargs)) for product in products)
+        
+        # Run all fetches concurrently so DB/API latency overlaps across products
+        executor = self._get_executor()
+        batch_futures = [(key, executor.submit(self._safe_fetch, fetch)) for key, fetch in batch_tasks]
+        futures = [(product, key, executor.submit(self._safe_fetch, fetch)) for product, key, fetch in tasks]
+        
+        gathered = {product: {"product": product} for product in products}
+        for key, future in batch_futures:
+            results = future.result()
+            for product in products:
+                # A failed batch call reports the same error for every product
+                gathered[product][key] = results if "error" in results else results[product]
+        for product, key, future in futures:
+            gathered[product][key] = future.result()
+        
+        # Check if any forecast should trigger supplier communication
+        forecasts = {
+            product: product_data["forecast"]
+            for product, product_data in gathered.items()
+            if "forecast" in product_data and "error" not in product_data["forecast"]
+        }
+        for product, supplier_action in self._supplier_actions(forecasts).items():
+            gathered[product]["supplier_communication"] = supplier_action
         
         return gathered
     
-    def _analyze_forecast_for_supplier_action(self, product: str, forecast_data: dict) -> dict:
-        """Check if forecast warrants supplier order recommendation"""
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Lazily create the thread pool used for concurrent data fetches"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS)
+        return self._executor
+    
+    @staticmethod
+    def _safe_fetch(fetch) -> Dict:
+        """Run a single data fetch, turning exceptions into an error dict"""
+        try:
+            return fetch()
+        except Exception as e:
+            return {"error": str(e)}
+    
+    def _supplier_actions(self, forecasts: Dict[str, dict]) -> Dict[str, dict]:
+        """
+        Supplier order analyses for products whose forecast moved significantly.
+        The change vs. history is scored for all products at once; only flagged
+        products run the (Gemini-backed) supplier agent, concurrently.
+        """
+        if not forecasts:
+            return {}
         
-        # Get historical baseline
-        historical = self.db.get_sales_trend(product, days=30)
-        if "error" in historical:
-            return {"should_contact": False}
+        products = list(forecasts)
+        forecast_totals = np.array([forecasts[product].get('total_predicted', 0) for product in products], dtype=np.float64)
+        historical_weekly = np.array([self._historical_weekly(product) for product in products], dtype=np.float64)
         
-        historical_weekly = historical['statistics']['avg_daily_sold'] * 7
-        forecast_total = forecast_data.get('total_predicted', 0)
+        # Products without history (NaN or 0 weekly sales) are zero-filled to a 0% change, so never flagged
+        change_pcts = np.divide(
+            forecast_totals - historical_weekly, historical_weekly,
+            out=np.zeros_like(forecast_totals), where=historical_weekly > 0
+        ) * 100
+        flagged = np.flatnonzero(np.abs(change_pcts) > SUPPLIER_CHANGE_TRIGGER_PCT)
+        if flagged.size == 0:
+            return {}
         
-        change_pct = ((forecast_total - historical_weekly) / historical_weekly * 100) if historical_weekly > 0 else 0
+        from agents.supplier_forecast_agent import SupplierForecastAgent
+        supplier_agent = SupplierForecastAgent(self.gemini, self.db)
+        executor = self._get_executor()
+        futures = [
+            (products[i], float(change_pcts[i]), executor.submit(supplier_agent.forecast_and_order, products[i], 7))
+            for i in flagged
+        ]
         
-        # Trigger supplier order analysis if significant change (>10%)
-        if abs(change_pct) > 10:
-            from agents.supplier_forecast_agent import SupplierForecastAgent
-            supplier_agent = SupplierForecastAgent(self.gemini)
-            
-            supplier_result = supplier_agent.forecast_and_order(product, 7)
-            
-            return {
+        actions = {}
+        for product, change_pct, future in futures:
+            supplier_result = future.result()
+            actions[product] = {
                 "should_contact": True,
                 "change_percentage": change_pct,
                 "order_analyzed": True,
@@ -225,18 +393,35 @@ When answering:
                 "reasoning": supplier_result.get('reasoning', ''),
                 "forecast_direction": "increase" if change_pct > 0 else "decrease"
             }
-        
-        return {"should_contact": False, "change_percentage": change_pct}
+        return actions
+    
+    def _historical_weekly(self, product: str) -> float:
+        """Average weekly units sold over the last 30 days, or NaN when unavailable (scored as no change)"""
+        historical = self.db.get_sales_trend(product, days=30)
+        if "error" in historical:
+            return np.nan
+        return historical['statistics']['avg_daily_sold'] * 7
 
     def _generate_response(self, user_message: str, data: Dict, session_data: Dict = None) -> str:
         """Generate natural language response using Gemini"""
         
+        response = self.gemini.generate_text(
+            user_prompt=self._build_response_context(user_message, data, session_data),
+            system_instruction=self.system_instruction,
+            temperature=0.7
+        )
+        
+        return response
+    
+    def _build_response_context(self, user_message: str, data: Dict, session_data: Dict = None) -> str:
+        """Build the answer prompt from the question, gathered data and history"""
+        
         # Build context
         context = f"""User asked: "{user_message}"
 
         Here is the relevant data from our system:
 
-        {json.dumps(data, indent=2)}
+        {format_for_llm(data)}
 
         Generate a detailed, helpful response that:
         1. Directly answers their question
@@ -248,40 +433,99 @@ When answering:
         Be conversational but data-driven. Always include specifics. For supplier order recommendations, mention the recommendation with details."""
         
         # Add conversation history if available
-        if session_data and "history" in session_data:
-            context = f"Previous conversation:\n{session_data['history']}\n\n{context}"
+        if session_data and (session_data.get("history") or session_data.get("summary")):
+            context = f"Previous conversation:\n{self._format_history(session_data)}\n\n{context}"
         
-        response = self.gemini.generate_text(
+        return context
+    
+    def record_turn(self, session_data: Dict, user_message: str, response: str) -> None:
+        """
+        Append a turn to the session history, keeping at most MAX_HISTORY_TURNS
+        verbatim. When the cap is exceeded, the older half is summarized by Gemini.
+        """
+        history = session_data.setdefault("history", [])
+        history.append({"user": user_message, "assistant": response})
+        
+        if len(history) > MAX_HISTORY_TURNS:
+            keep = MAX_HISTORY_TURNS // 2
+            older = history[:-keep]
+            session_data["history"] = history[-keep:]
+            session_data["summary"] = self._summarize_history(session_data.get("summary"), older)
+    
+    def _summarize_history(self, summary: Optional[str], turns: List[Dict]) -> str:
+        """Compress earlier turns (and any previous summary) into a short summary"""
+        transcript = self._format_turns(turns)
+        if summary:
+            transcript = f"Earlier summary: {summary}\n{transcript}"
+        
+        try:
+            return self.gemini.generate_text(
+                user_prompt=f"Summarize this conversation in 2 sentences, keeping products, numbers and decisions:\n\n{transcript}",
+                system_instruction="You summarize conversations concisely.",
+                temperature=0.2
+            )
+        except Exception:
+            # Keep the previous summary rather than failing the chat turn
+            return summary or ""
+    
+    def _format_history(self, session_data: Dict) -> str:
+        """Render the running summary and recent turns for the prompt"""
+        parts = []
+        if session_data.get("summary"):
+            parts.append(f"Summary of earlier conversation: {session_data['summary']}")
+        parts.append(self._format_turns(session_data.get("history", [])[-MAX_HISTORY_TURNS:]))
+        return "\n".join(part for part in parts if part)
+    
+    @staticmethod
+    def _format_turns(turns: List[Dict]) -> str:
+        """Render conversation turns as plain User/Assistant lines"""
+        return "\n".join(f"User: {turn['user']}\nAssistant: {turn['assistant']}" for turn in turns)
+    
+    def get_proactive_greeting(self) -> str:
+        """Generate proactive greeting with current insights"""
+        context = self._greeting_prompt()
+        if context is None:
+            return ALL_CLEAR_GREETING
+        
+        return self.gemini.generate_text(
             user_prompt=context,
             system_instruction=self.system_instruction,
-            temperature=0.7
+            temperature=0.8
         )
+    
+    def get_proactive_greeting_stream(self) -> Iterator[str]:
+        """Like get_proactive_greeting, but yield the greeting in chunks as Gemini generates it"""
+        context = self._greeting_prompt()
+        if context is None:
+            yield ALL_CLEAR_GREETING
+            return
         
-        return response
+        yield from self.gemini.generate_text_stream(
+            user_prompt=context,
+            system_instruction=self.system_instruction,
+            temperature=0.8
+        )
     
-    def get_proactive_greeting(self) -> str:
-        """Generate proactive greeting with current insights"""
+    def _greeting_prompt(self) -> Optional[str]:
+        """Build the greeting prompt from current insights, or None if nothing needs attention"""
+        # Only the most urgent flagged products are worth mentioning
+        insights = [
+            {
+                "product": rec["product"],
+                "urgency": rec["urgency"],
+                "discount": rec["recommended_discount_pct"],
+                "reason": rec["reasoning"]
+            }
+            for rec in self.db.get_products_needing_discount(limit=3)
+        ]
+        
+        if not insights:
+            return None
         
-        # Get current status for all products
-        all_products = self.db.get_all_products()
-        insights = []
-        
-        for product in all_products:
-            discount_rec = self.db.get_discount_recommendation(product)
-            if discount_rec.get("needs_discount"):
-                insights.append({
-                    "product": product,
-                    "urgency": discount_rec["urgency"],
-                    "discount": discount_rec["recommended_discount_pct"],
-                    "reason": discount_rec["reasoning"]
-                })
-        
-        # Generate greeting
-        if insights:
-            context = f"""Generate a friendly, proactive greeting for the store manager.
+        return f"""Generate a friendly, proactive greeting for the store manager.
 
             Current situation:
-            {json.dumps(insights, indent=2)}
+            {format_for_llm(insights)}
 
             The greeting should:
             - Be warm and professional
@@ -290,13 +534,3 @@ When answering:
             - End with "How can I help you today?" or similar
 
             Keep it concise (3-4 sentences)."""
-            
-            greeting = self.gemini.generate_text(
-                user_prompt=context,
-                system_instruction=self.system_instruction,
-                temperature=0.8
-            )
-        else:
-            greeting = "Good morning! All products are performing well today with low waste rates. How can I help you manage your inventory?"
-        
-        return greeting
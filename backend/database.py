@@ -1,67 +1,242 @@
 import pandas as pd
-import pickle
+import joblib
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import numpy as np
-from flask import jsonify
+
+# Sort order for discount urgency (most urgent first)
+URGENCY_RANK = {"high": 0, "medium": 1, "low": 2, "none": 3}
+
+# A product needs a discount above this waste rate (%) or below this sales-vs-forecast (%)
+DISCOUNT_WASTE_TRIGGER_PCT = 15
+DISCOUNT_PERFORMANCE_TRIGGER_PCT = 70
+
+# Waste-rate (%) tier boundaries; exceeding each one moves up a discount/urgency tier
+DISCOUNT_WASTE_THRESHOLDS = np.array([15, 25])
+DISCOUNT_TIER_PCT = np.array([15, 20, 30])
+DISCOUNT_TIER_URGENCY = np.array(["low", "medium", "high"])
+
+# Days-until-expiry boundaries for inventory urgency: <0 expired, 0-2 critical, 3-5 high, 6-14 medium, else low
+EXPIRY_URGENCY_BOUNDS = np.array([0, 3, 6, 15])
+EXPIRY_URGENCY_LABELS = np.array(["expired", "critical", "high", "medium", "low"])
+# Urgency levels listed as urgent in the inventory overview
+URGENT_EXPIRY_LEVELS = ("expired", "critical", "high")
+
+# Inventory batches written by the inventory generator; re-read only when the file changes
+INVENTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output', 'inventory.csv')
+
+# Column types for the daily sales CSV, so read_csv skips dtype inference
+SALES_DTYPES = {
+    'product': 'category',
+    'items_sold': 'int32',
+    'items_wasted': 'int32',
+    'day_of_week': 'int8',
+    'is_weekend': 'bool',
+    'is_holiday': 'bool'
+}
+CSV_DATE_FORMAT = '%Y-%m-%d'
+
+# Upper bound on threads used to deserialize models in parallel
+MAX_MODEL_LOAD_WORKERS = 8
+# Mmap-able copies of legacy pickled models; the checked-in model files are never rewritten
+MODEL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.model_cache')
+
+# How long (seconds) a Prophet forecast is reused for the same product and horizon
+PREDICTION_CACHE_TTL = 3600
+# Oldest forecasts are evicted beyond this many (product, horizon, day) entries
+PREDICTION_CACHE_SIZE = 1024
 
 class Database:
     """Data access layer for sales, weather, and predictions"""
     
     def __init__(self):
-        self.sales_df = pd.read_csv('data/daily_sales_dataset.csv')
-        self.sales_df['date'] = pd.to_datetime(self.sales_df['date'])
+        # Explicit narrow dtypes and read-time date parsing; few distinct products,
+        # so store them as categorical codes rather than strings
+        self.sales_df = pd.read_csv(
+            'data/daily_sales_dataset.csv',
+            dtype=SALES_DTYPES,
+            parse_dates=['date'],
+            date_format=CSV_DATE_FORMAT
+        )
+        
+        # Per-product views sorted and indexed by date, so lookups don't rescan the whole frame
+        self._sales_by_product = {
+            product: group.sort_values('date', kind='stable')
+                          .set_index('date', drop=False)
+                          .rename_axis(None)
+            for product, group in self.sales_df.groupby('product', sort=False, observed=True)
+        }
         
-        self.weather_df = pd.read_csv('data/daily_weather_data.csv')
-        self.weather_df['date'] = pd.to_datetime(self.weather_df['date'])
+        self.weather_df = pd.read_csv(
+            'data/daily_weather_data.csv',
+            parse_dates=['date'],
+            date_format=CSV_DATE_FORMAT
+        )
+        
+        # Both sources are static, so join each product's sales to the weather once
+        self._sales_weather_by_product = {
+            product: product_sales[['date', 'items_sold']].merge(self.weather_df, on='date', how='left')
+            for product, product_sales in self._sales_by_product.items()
+        }
         
-        self.models = self._load_models()
+        # Models are unpickled lazily on first use (see get_model)
+        self._model_paths = self._discover_models()
+        self.models = {}
+        # File mtime each loaded model came from, so retrained models are picked up
+        self._model_mtimes = {}
+        # One lock per model so different products can load concurrently
+        self._model_locks = {product: threading.Lock() for product in self._model_paths}
+        
+        self._prediction_cache = OrderedDict()
+        self._prediction_cache_lock = threading.Lock()
+        
+        # (mtime, parsed inventory.csv, batches per product sorted by expiry, per-product totals)
+        # so inventory lookups neither reparse the file nor rescan or re-aggregate its rows
+        self._inventory = (None, None, None, None)
+        self._inventory_lock = threading.Lock()
     
-    def _load_models(self) -> Dict:
-        """Load trained Prophet models"""
-        models = {}
+    def _discover_models(self) -> Dict[str, str]:
+        """Map product names to trained Prophet model files"""
+        model_paths = {}
         model_dir = 'models'
         
         if not os.path.exists(model_dir):
-            return models
+            return model_paths
         
-        for filename in os.listdir(model_dir):
-            if filename.endswith('_model.pkl'):
-                product = filename.replace('_model.pkl', '').replace('_', ' ')
+        with os.scandir(model_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('_model.pkl') and entry.is_file():
+                    product = entry.name.replace('_model.pkl', '').replace('_', ' ')
+                    model_paths[product] = entry.path
+        
+        return model_paths
+    
+    def get_model(self, product: str):
+        """Load a trained Prophet model the first time it is needed, or after its file changes"""
+        model = self.models.get(product)
+        path = self._model_paths.get(product)
+        if path is None or (model is not None and self._model_is_current(product, path)):
+            return model
+        
+        with self._model_locks[product]:
+            model = self.models.get(product)
+            if product in self._model_paths and (model is None or not self._model_is_current(product, path)):
                 try:
-                    with open(os.path.join(model_dir, filename), 'rb') as f:
-                        models[product] = pickle.load(f)
+                    model = self._load_model_file(path)
+                    self.models[product] = model
+                    self._model_mtimes[product] = os.stat(path).st_mtime
+                    self._drop_cached_predictions(product)
                 except Exception as e:
-                    print(f"Error loading {filename}: {e}")
+                    print(f"Error loading {os.path.basename(path)}: {e}")
+                    if product not in self.models:
+                        # Don't retry a broken model file on every request
+                        del self._model_paths[product]
         
-        return models
+        return model
+    
+    def _model_is_current(self, product: str, path: str) -> bool:
+        """Whether the loaded model still matches the file on disk"""
+        try:
+            return os.stat(path).st_mtime == self._model_mtimes.get(product)
+        except OSError:
+            # File removed or unreadable: keep serving the loaded model
+            return True
+    
+    @staticmethod
+    def _load_model_file(path: str):
+        """Load a model memory-mapped, reading legacy pickles through a joblib copy in MODEL_CACHE_DIR"""
+        cache_path = os.path.join(MODEL_CACHE_DIR, os.path.basename(path))
+        try:
+            if os.path.getmtime(cache_path) >= os.path.getmtime(path):
+                return joblib.load(cache_path, mmap_mode='r')
+        except OSError:
+            pass
+        
+        # Memory-map the fitted arrays so forked workers share pages
+        model = joblib.load(path, mmap_mode='r')
+        
+        params = getattr(model, 'params', None) or {}
+        if any(isinstance(value, np.ndarray) and not isinstance(value, np.memmap) for value in params.values()):
+            # Plain pickle: save an uncompressed copy so the next load can mmap it
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+                joblib.dump(model, tmp_path, compress=0)
+                os.replace(tmp_path, cache_path)
+                model = joblib.load(cache_path, mmap_mode='r')
+            except OSError as e:
+                print(f"Could not cache {os.path.basename(path)} in joblib format: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        
+        return model
+    
+    def preload_models(self) -> int:
+        """Load every discovered model in parallel, returning how many are ready"""
+        products = list(self._model_paths)
+        if not products:
+            return 0
+        
+        workers = min(MAX_MODEL_LOAD_WORKERS, os.cpu_count() or 1, len(products))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            loaded = list(executor.map(self.get_model, products))
+        
+        return sum(model is not None for model in loaded)
+    
+    def _product_sales(self, product: str) -> pd.DataFrame:
+        """Get the date-sorted sales rows for one product (empty if unknown)"""
+        product_sales = self._sales_by_product.get(product)
+        if product_sales is None:
+            return self.sales_df.iloc[0:0]
+        return product_sales
     
     def get_all_products(self) -> List[str]:
         """Get list of all products"""
-        return self.sales_df['product'].unique().tolist()
+        return list(self._sales_by_product)
     
     def get_current_status(self, product: str, date: Optional[datetime] = None) -> Dict:
         """Get current sales status for a product on a specific date"""
         if date is None:
             date = datetime.now().date()
         
-        # Get sales for this date
-        sales_today = self.sales_df[
-            (self.sales_df['product'] == product) & 
-            (self.sales_df['date'].dt.date == date)
-        ]
-        
-        if sales_today.empty:
-            # Get most recent data
-            sales_today = self.sales_df[
-                self.sales_df['product'] == product
-            ].tail(1)
+        product_sales = self._product_sales(product)
         
-        if sales_today.empty:
+        if product_sales.empty:
             return {"error": f"No data found for {product}"}
         
-        row = sales_today.iloc[0]
+        return self._format_current_status(product, self._sales_row_for_date(product_sales, date))
+
+    def get_current_status_many(self, products: List[str], date: Optional[datetime] = None) -> Dict[str, Dict]:
+        """Get current sales status for several products in a single pass"""
+        if date is None:
+            date = datetime.now().date()
+        
+        results = {}
+        for product in products:
+            product_sales = self._product_sales(product)
+            if product_sales.empty:
+                results[product] = {"error": f"No data found for {product}"}
+                continue
+            
+            results[product] = self._format_current_status(product, self._sales_row_for_date(product_sales, date))
+        
+        return results
+
+    @staticmethod
+    def _sales_row_for_date(product_sales: pd.DataFrame, date) -> pd.Series:
+        """Get the row for a date from the date index, falling back to the most recent row"""
+        ts = pd.Timestamp(date).normalize()
+        if ts in product_sales.index:
+            return product_sales.loc[ts]
+        return product_sales.iloc[-1]
+
+    def _format_current_status(self, product: str, row: pd.Series) -> Dict:
+        """Build the current status payload from a sales row"""
         result = {
             "product": product,
             "date": str(row['date'].date()),
@@ -70,27 +245,34 @@ class Database:
             "is_weekend": bool(row['is_weekend']),
             "is_holiday": bool(row['is_holiday'])
         }
-        return convert_types(result)
+        return result
 
     def get_sales_trend(self, product: str, days: int = 30) -> Dict:
         """Get sales trend for past N days"""
-        product_data = self.sales_df[self.sales_df['product'] == product].copy()
-        product_data = product_data.sort_values('date').tail(days)
-        
-        trend_data = []
-        for _, row in product_data.iterrows():
-            trend_data.append({
-                "date": str(row['date'].date()),
-                "items_sold": int(row['items_sold']),
-                "items_wasted": int(row['items_wasted']),
-                "day_of_week": row['date'].strftime("%A")
-            })
+        product_data = self._product_sales(product).tail(days)
+        
+        # Read each column once; the row dicts and the statistics share these arrays
+        dates = product_data['date']
+        sold = product_data['items_sold'].to_numpy()
+        wasted = product_data['items_wasted'].to_numpy()
+        trend_data = [
+            {"date": date_str, "items_sold": items_sold, "items_wasted": items_wasted, "day_of_week": day_name}
+            for date_str, items_sold, items_wasted, day_name in zip(
+                dates.dt.strftime('%Y-%m-%d').to_numpy(),
+                sold.tolist(),
+                wasted.tolist(),
+                dates.dt.strftime('%A').to_numpy()
+            )
+        ]
         
         # Calculate statistics
-        avg_sold = product_data['items_sold'].mean()
-        avg_wasted = product_data['items_wasted'].mean()
-        waste_rate = (product_data['items_wasted'].sum() / 
-                     (product_data['items_sold'].sum() + product_data['items_wasted'].sum()) * 100)
+        num_days = len(sold)
+        total_sold = int(sold.sum())
+        total_wasted = int(wasted.sum())
+        total_handled = total_sold + total_wasted
+        avg_sold = total_sold / num_days if num_days else float('nan')
+        avg_wasted = total_wasted / num_days if num_days else float('nan')
+        waste_rate = total_wasted / total_handled * 100 if total_handled else float('nan')
         
         result = {
             "product": product,
@@ -100,99 +282,177 @@ class Database:
                 "avg_daily_sold": round(avg_sold, 1),
                 "avg_daily_wasted": round(avg_wasted, 1),
                 "waste_rate_pct": round(waste_rate, 1),
-                "total_sold": int(product_data['items_sold'].sum()),
-                "total_wasted": int(product_data['items_wasted'].sum())
+                "total_sold": total_sold,
+                "total_wasted": total_wasted
             }
         }
-        return convert_types(result)
+        return result
 
-    def get_prophet_prediction(self, product: str, days_ahead: int = 7) -> Dict:
-        """Get Prophet forecast for next N days using real weather data"""
-        if product not in self.models:
-            return {"error": f"No trained model for {product}"}
-        
-        model = self.models[product]
-        
+    def get_prophet_prediction(self, product: str, days_ahead: int = 7, weather: Optional[tuple] = None) -> Dict:
+        """
+        Get Prophet forecast for next N days using real weather data.
+        Forecasts are cached per product, horizon and day for PREDICTION_CACHE_TTL seconds
+        (at most PREDICTION_CACHE_SIZE entries).
+        
+        Args:
+            product: Product name
+            days_ahead: Forecast horizon in days
+            weather: Optional (weather_data, weather_source) already fetched for this horizon
+        """
+        cache_key = (product, days_ahead, datetime.now().date())
+        with self._prediction_cache_lock:
+            cached = self._prediction_cache.get(cache_key)
+            if cached is not None:
+                if time.monotonic() - cached['timestamp'] < PREDICTION_CACHE_TTL:
+                    return copy_prediction(cached['data'])
+                del self._prediction_cache[cache_key]
+        
+        result = self._predict_uncached(product, days_ahead, weather)
+        if "error" not in result:
+            self._remember_prediction(cache_key, result)
+        return result
+    
+    def _remember_prediction(self, cache_key: tuple, result: Dict):
+        """Cache a forecast, dropping expired entries and evicting the oldest beyond PREDICTION_CACHE_SIZE"""
+        now = time.monotonic()
+        with self._prediction_cache_lock:
+            self._prediction_cache[cache_key] = {'data': copy_prediction(result), 'timestamp': now}
+            self._prediction_cache.move_to_end(cache_key)
+            # Entries are in write order, so expired ones collect at the front
+            while self._prediction_cache:
+                oldest = next(iter(self._prediction_cache.values()))
+                if len(self._prediction_cache) <= PREDICTION_CACHE_SIZE and now - oldest['timestamp'] < PREDICTION_CACHE_TTL:
+                    break
+                self._prediction_cache.popitem(last=False)
+    
+    def get_prophet_prediction_many(self, products: List[str], days_ahead: int = 7) -> Dict[str, Dict]:
+        """Forecast several products, sharing one weather fetch and predicting in parallel"""
+        if not products:
+            return {}
+        
+        weather = self._fetch_weather(days_ahead)
+        workers = min(MAX_MODEL_LOAD_WORKERS, len(products))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            forecasts = executor.map(lambda product: self.get_prophet_prediction(product, days_ahead, weather), products)
+            return dict(zip(products, forecasts))
+    
+    def clear_cache(self):
+        """Drop cached forecasts, e.g. after new sales data is loaded"""
+        with self._prediction_cache_lock:
+            self._prediction_cache = OrderedDict()
+    
+    def _drop_cached_predictions(self, product: str):
+        """Drop cached forecasts for one product, e.g. after its model is reloaded"""
+        with self._prediction_cache_lock:
+            self._prediction_cache = OrderedDict(
+                (key, entry) for key, entry in self._prediction_cache.items() if key[0] != product
+            )
+    
+    @staticmethod
+    def _fetch_weather(days_ahead: int) -> tuple:
+        """Get (weather_data, weather_source) for the horizon, falling back to mock data"""
         # Try to get real weather data, fallback to mock if needed
         try:
-            weather_data = weather_service.get_forecast(days_ahead)
-            weather_source = "OpenWeather API"
+            return weather_service.get_forecast(days_ahead), "OpenWeather API"
         except Exception as e:
             print(f"Weather API failed, using mock data: {str(e)}")
-            weather_data = generate_mock_weather_data(days_ahead)
-            weather_source = "Mock Data (API unavailable)"
+            return generate_mock_weather_data(days_ahead), "Mock Data (API unavailable)"
+    
+    def _predict_uncached(self, product: str, days_ahead: int, weather: Optional[tuple] = None) -> Dict:
+        """Run the Prophet model for the next N days"""
+        model = self.get_model(product)
+        if model is None:
+            return {"error": f"No trained model for {product}"}
+        
+        weather_data, weather_source = weather or self._fetch_weather(days_ahead)
         
         # Create future dataframe with weather data
-        last_date = self.sales_df[self.sales_df['product'] == product]['date'].max()
+        last_date = self._product_sales(product)['date'].max()
         future_dates = pd.date_range(start=last_date + timedelta(days=1), periods=days_ahead)
+        is_weekend = future_dates.dayofweek.to_numpy() >= 5
         
+        # Pull the two regressor columns straight into one float array instead of an intermediate frame
+        weather_values = np.array(
+            [(day['temperature'], day['precipitation']) for day in weather_data], dtype=np.float64
+        ).reshape(-1, 2)
         future = pd.DataFrame({
             'ds': future_dates,
-            'temperature': [day['temperature'] for day in weather_data],
-            'precipitation': [day['precipitation'] for day in weather_data],
-            'is_weekend': [1 if d.dayofweek >= 5 else 0 for d in future_dates],
-            'is_holiday': [0] * days_ahead
+            'temperature': weather_values[:, 0],
+            'precipitation': weather_values[:, 1],
+            'is_weekend': is_weekend.view(np.int8),
+            'is_holiday': np.zeros(days_ahead, dtype=np.int8)
         })
         
         # Use model.predict() with weather data
         try:
             forecast = model.predict(future)
             
-            predictions = []
-            for i, row in forecast.iterrows():
-                weather_day = weather_data[i]
-                predictions.append({
-                    "date": str(row['ds'].date()),
-                    "day_of_week": row['ds'].strftime("%A"),
-                    "predicted_demand": round(row['yhat'], 1),
-                    "lower_bound": round(row['yhat_lower'], 1),
-                    "upper_bound": round(row['yhat_upper'], 1),
+            # Forecast rows line up with future_dates, so reuse the precomputed date columns
+            predictions = [
+                {
+                    "date": date_str,
+                    "day_of_week": day_name,
+                    "predicted_demand": round(float(yhat), 1),
+                    "lower_bound": round(float(lower), 1),
+                    "upper_bound": round(float(upper), 1),
                     "weather_description": weather_day['description'],
                     "temperature": weather_day['temperature'],
                     "precipitation": weather_day['precipitation'],
-                    "is_weekend": bool(row['ds'].dayofweek >= 5)
-                })
+                    "is_weekend": bool(weekend)
+                }
+                for date_str, day_name, yhat, lower, upper, weekend, weather_day in zip(
+                    future_dates.strftime('%Y-%m-%d'),
+                    future_dates.day_name(),
+                    forecast['yhat'].to_numpy(),
+                    forecast['yhat_lower'].to_numpy(),
+                    forecast['yhat_upper'].to_numpy(),
+                    is_weekend,
+                    weather_data
+                )
+            ]
             
             result = {
                 "product": product,
                 "forecast_days": days_ahead,
                 "predictions": predictions,
                 "weather_source": weather_source,
-                "total_predicted": round(forecast['yhat'].sum(), 1)
+                "total_predicted": round(float(forecast['yhat'].sum()), 1)
             }
-            return convert_types(result)
+            return result
             
         except Exception as e:
             return {"error": f"Prophet prediction failed: {str(e)}"}
 
     def get_weather_correlation(self, product: str) -> Dict:
         """Analyze weather's impact on sales"""
-        product_data = self.sales_df[self.sales_df['product'] == product].copy()
-        
-        # Merge with weather
-        merged = product_data.merge(self.weather_df, on='date', how='left')
+        merged = self._sales_weather_by_product.get(product)
         
-        if merged.empty or 'temperature_2m_mean' not in merged.columns:
+        if merged is None or merged.empty or 'temperature_2m_mean' not in merged.columns:
             return {"error": "Weather data not available"}
         
-        # Calculate correlation
-        temp_corr = merged['items_sold'].corr(merged['temperature_2m_mean'])
-        rain_days = merged[merged['precipitation_sum'] > 0.1]
+        sold = merged['items_sold'].to_numpy(dtype=float)
+        temps = merged['temperature_2m_mean'].to_numpy(dtype=float)
+        precip = merged['precipitation_sum'].to_numpy(dtype=float)
         
-        avg_sales_rain = rain_days['items_sold'].mean() if not rain_days.empty else 0
-        avg_sales_no_rain = merged[merged['precipitation_sum'] <= 0.1]['items_sold'].mean()
+        temp_corr = pearson_correlation(sold, temps)
+        
+        # Days without weather data count as neither rainy nor clear
+        rain = precip > 0.1
+        clear = precip <= 0.1
+        avg_sales_rain = sold[rain].mean() if rain.any() else 0
+        avg_sales_no_rain = sold[clear].mean() if clear.any() else np.nan
         
         rain_impact_pct = ((avg_sales_rain - avg_sales_no_rain) / avg_sales_no_rain * 100) if avg_sales_no_rain > 0 else 0
         
         result = {
             "product": product,
-            "temperature_correlation": round(temp_corr, 3),
-            "rain_impact_pct": round(rain_impact_pct, 1),
-            "avg_sales_rainy_days": round(avg_sales_rain, 1),
-            "avg_sales_clear_days": round(avg_sales_no_rain, 1),
+            "temperature_correlation": round(float(temp_corr), 3),
+            "rain_impact_pct": round(float(rain_impact_pct), 1),
+            "avg_sales_rainy_days": round(float(avg_sales_rain), 1),
+            "avg_sales_clear_days": round(float(avg_sales_no_rain), 1),
             "interpretation": self._interpret_weather_impact(temp_corr, rain_impact_pct)
         }
-        return convert_types(result)
+        return result
 
     def _interpret_weather_impact(self, temp_corr: float, rain_impact: float) -> str:
         """Generate human-readable interpretation"""
@@ -218,53 +478,92 @@ class Database:
     def get_discount_recommendation(self, product: str) -> Dict:
         """Calculate if product needs discounting"""
         # Get latest data
-        latest = self.sales_df[self.sales_df['product'] == product].tail(7)
+        latest = self._product_sales(product).tail(7)
         
         if latest.empty:
             return {"error": f"No recent data for {product}"}
         
-        # Calculate waste rate
-        total_sold = latest['items_sold'].sum()
-        total_wasted = latest['items_wasted'].sum()
-        waste_rate = (total_wasted / (total_sold + total_wasted) * 100) if (total_sold + total_wasted) > 0 else 0
-        
+        return self._build_discount_recommendation(product, latest)
+    
+    def get_discount_recommendation_many(self, products: List[str]) -> Dict[str, Dict]:
+        """Calculate discount recommendations for several products at once"""
+        recommendations = self._score_discounts({
+            product: self._product_sales(product).tail(7)
+            for product in products if product in self._sales_by_product
+        })
+        return {
+            product: recommendations.get(product, {"error": f"No recent data for {product}"})
+            for product in products
+        }
+    
+    def get_products_needing_discount(self, limit: int = 5) -> List[Dict]:
+        """Discount recommendations for flagged products only, most urgent first"""
+        recommendations = self.get_discount_recommendation_many(self.get_all_products())
+        flagged = [rec for rec in recommendations.values() if rec.get("needs_discount")]
+        flagged.sort(key=lambda rec: (URGENCY_RANK[rec["urgency"]], -rec["waste_rate_pct"]))
+        return flagged[:limit]
+    
+    def _build_discount_recommendation(self, product: str, latest: pd.DataFrame) -> Dict:
+        """Build the discount recommendation from a product's latest sales rows"""
+        return self._score_discounts({product: latest})[product]
+    
+    def _score_discounts(self, latest_by_product: Dict[str, pd.DataFrame]) -> Dict[str, Dict]:
+        """Score discount recommendations for products in one vectorized pass"""
+        products = list(latest_by_product)
+        inputs = np.array(
+            [self._discount_inputs(product, latest_by_product[product]) for product in products],
+            dtype=np.float64
+        ).reshape(-1, 4)
+        
+        waste_rates, performances = calculate_discount_inputs(*inputs.T)
+        needs, discounts, urgencies = calculate_discounts(waste_rates, performances)
+        
+        return {
+            product: self._format_discount_recommendation(
+                product, waste_rates[i], performances[i], needs[i], discounts[i], urgencies[i]
+            )
+            for i, product in enumerate(products)
+        }
+    
+    def _discount_inputs(self, product: str, latest: pd.DataFrame) -> tuple:
+        """
+        Raw inputs for the discount decision from the latest sales rows.
+        
+        Returns:
+            Tuple of (total sold, total wasted, actual sold today, predicted today);
+            predicted is NaN when no prediction is available
+        """
         # Get prediction for today
         prediction = self.get_prophet_prediction(product, days_ahead=1)
         
         if "error" not in prediction and prediction['predictions']:
             predicted_today = prediction['predictions'][0]['predicted_demand']
-            actual_today = latest.iloc[-1]['items_sold']
-            performance = (actual_today / predicted_today * 100) if predicted_today > 0 else 100
-        else:
-            performance = 100
-        
-        # Decision logic
-        needs_discount = waste_rate > 15 or performance < 70
-        
-        if needs_discount:
-            if waste_rate > 25:
-                discount = 30
-                urgency = "high"
-            elif waste_rate > 15:
-                discount = 20
-                urgency = "medium"
-            else:
-                discount = 15
-                urgency = "low"
         else:
-            discount = 0
-            urgency = "none"
-        
+            predicted_today = np.nan
+        
+        # Trailing-window figures straight from the column arrays (no per-row Series)
+        sold = latest['items_sold'].to_numpy()
+        return (
+            sold.sum(),
+            latest['items_wasted'].to_numpy().sum(),
+            sold[-1],
+            predicted_today
+        )
+    
+    def _format_discount_recommendation(self, product: str, waste_rate: float, performance: float,
+                                        needs_discount: bool, discount: int, urgency: str) -> Dict:
+        """Build the discount recommendation payload"""
+        urgency = str(urgency)
         result = {
             "product": product,
-            "needs_discount": needs_discount,
-            "recommended_discount_pct": discount,
+            "needs_discount": bool(needs_discount),
+            "recommended_discount_pct": int(discount),
             "urgency": urgency,
-            "waste_rate_pct": round(waste_rate, 1),
-            "performance_vs_prediction_pct": round(performance, 1),
+            "waste_rate_pct": round(float(waste_rate), 1),
+            "performance_vs_prediction_pct": round(float(performance), 1),
             "reasoning": self._generate_discount_reasoning(waste_rate, performance, urgency)
         }
-        return convert_types(result)
+        return result
     
     def _generate_discount_reasoning(self, waste_rate: float, performance: float, urgency: str) -> str:
         """Generate reasoning for discount recommendation"""
@@ -272,63 +571,90 @@ class Database:
             return "Product is performing well with low waste"
         
         reasons = []
-        if waste_rate > 15:
+        if waste_rate > DISCOUNT_WASTE_TRIGGER_PCT:
             reasons.append(f"High waste rate ({waste_rate:.0f}%)")
-        if performance < 70:
+        if performance < DISCOUNT_PERFORMANCE_TRIGGER_PCT:
             reasons.append(f"Underperforming vs forecast ({performance:.0f}%)")
         
         return " and ".join(reasons)
 
-    def get_inventory_status(self, product: str) -> Dict:
-        """Get current inventory status from inventory.csv"""
+    def _load_inventory(self) -> Optional[tuple]:
+        """
+        Parsed inventory.csv, reused until the file changes (treat as read-only).
+        
+        Returns:
+            Tuple of (inventory frame, {product: batches sorted by expiration},
+            per-product total_quantity/nearest_expiration frame), or None if missing
+        """
         try:
-            import os
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-            inventory_file = os.path.join(base_dir, 'output', 'inventory.csv')
-            
-            if not os.path.exists(inventory_file):
+            mtime = os.stat(INVENTORY_FILE).st_mtime
+        except FileNotFoundError:
+            return None
+        
+        with self._inventory_lock:
+            if self._inventory[0] != mtime:
+                inventory_df = pd.read_csv(
+                    INVENTORY_FILE,
+                    dtype={'product': 'category'},
+                    parse_dates=['expirationDate', 'dateBought'],
+                    date_format=CSV_DATE_FORMAT
+                )
+                by_product = {
+                    product: batches.sort_values('expirationDate')
+                    for product, batches in inventory_df.groupby('product', sort=False, observed=True)
+                }
+                summary = inventory_df.groupby('product', sort=False, observed=True).agg(
+                    total_quantity=('quantity', 'sum'),
+                    nearest_expiration=('expirationDate', 'min')
+                )
+                self._inventory = (mtime, inventory_df, by_product, summary)
+            return self._inventory[1:]
+    
+    def get_inventory_status(self, product: str, now: Optional[pd.Timestamp] = None) -> Dict:
+        """
+        Get current inventory status from inventory.csv.
+        
+        Args:
+            product: Product name
+            now: Reference time for expiry math; pass one value when checking many products
+        """
+        if now is None:
+            now = pd.Timestamp.now()
+        
+        try:
+            inventory = self._load_inventory()
+            if inventory is None:
                 return {"error": f"Inventory file not found"}
             
-            inventory_df = pd.read_csv(inventory_file)
-            inventory_df['expirationDate'] = pd.to_datetime(inventory_df['expirationDate'])
-            inventory_df['dateBought'] = pd.to_datetime(inventory_df['dateBought'])
-            
-            # Filter for this product
-            product_inv = inventory_df[inventory_df['product'] == product]
+            # This product's batches, already sorted by expiration date (soonest first)
+            product_inv = inventory[1].get(product)
             
-            if product_inv.empty:
+            if product_inv is None or product_inv.empty:
                 return {"error": f"No inventory data for {product}"}
             
-            # Sort by expiration date (soonest first)
-            product_inv = product_inv.sort_values('expirationDate')
-            
             # Calculate totals and urgency
             total_quantity = int(product_inv['quantity'].sum())
             nearest_expiry = product_inv.iloc[0]
-            days_until_expiry = (nearest_expiry['expirationDate'] - pd.Timestamp.now()).days
+            days_until_expiry = (nearest_expiry['expirationDate'] - now).days
             
             # Categorize urgency
-            if days_until_expiry < 0:
-                urgency = "expired"
-            elif days_until_expiry <= 2:
-                urgency = "critical"
-            elif days_until_expiry <= 5:
-                urgency = "high"
-            elif days_until_expiry <= 14:
-                urgency = "medium"
-            else:
-                urgency = "low"
+            urgency = str(classify_expiry_urgency(np.array([days_until_expiry]))[0])
             
-            # Build batch details
-            batches = []
-            for _, row in product_inv.iterrows():
-                batch_days = (row['expirationDate'] - pd.Timestamp.now()).days
-                batches.append({
-                    "quantity": int(row['quantity']),
-                    "expiration_date": str(row['expirationDate'].date()),
+            # Build batch details from whole columns rather than row by row
+            batches = [
+                {
+                    "quantity": quantity,
+                    "expiration_date": expiration_date,
                     "days_until_expiry": batch_days,
-                    "date_bought": str(row['dateBought'].date())
-                })
+                    "date_bought": date_bought
+                }
+                for quantity, expiration_date, batch_days, date_bought in zip(
+                    product_inv['quantity'].tolist(),
+                    product_inv['expirationDate'].dt.strftime(CSV_DATE_FORMAT).tolist(),
+                    (product_inv['expirationDate'] - now).dt.days.tolist(),
+                    product_inv['dateBought'].dt.strftime(CSV_DATE_FORMAT).tolist()
+                )
+            ]
             
             return {
                 "product": product,
@@ -347,34 +673,35 @@ class Database:
     def get_all_inventory_overview(self) -> Dict:
         """Get high-level overview of all inventory"""
         try:
-            import os
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-            inventory_file = os.path.join(base_dir, 'output', 'inventory.csv')
-            
-            if not os.path.exists(inventory_file):
+            inventory = self._load_inventory()
+            if inventory is None:
                 return {"error": "Inventory file not found"}
-            
-            inventory_df = pd.read_csv(inventory_file)
-            inventory_df['expirationDate'] = pd.to_datetime(inventory_df['expirationDate'])
+            # Per-product totals and nearest expiry, aggregated once per inventory file (products in file order);
+            # only the clock-dependent urgency is computed per call
+            summary = inventory[2]
+            days_until_expiry = (summary['nearest_expiration'] - pd.Timestamp.now()).dt.days.to_numpy()
+            urgencies = classify_expiry_urgency(days_until_expiry)
             
             # Summary by urgency
-            urgent_items = []
-            all_products = inventory_df['product'].unique()
-            
-            for product in all_products:
-                product_status = self.get_inventory_status(product)
-                if "error" not in product_status:
-                    if product_status['urgency'] in ['expired', 'critical', 'high']:
-                        urgent_items.append({
-                            "product": product,
-                            "urgency": product_status['urgency'],
-                            "days_until_expiry": product_status['days_until_nearest_expiry'],
-                            "quantity": product_status['total_quantity']
-                        })
+            urgent_mask = np.isin(urgencies, URGENT_EXPIRY_LEVELS)
+            urgent_items = [
+                {
+                    "product": product,
+                    "urgency": urgency,
+                    "days_until_expiry": days,
+                    "quantity": quantity
+                }
+                for product, urgency, days, quantity in zip(
+                    summary.index[urgent_mask].tolist(),
+                    urgencies[urgent_mask].tolist(),
+                    days_until_expiry[urgent_mask].tolist(),
+                    summary['total_quantity'].to_numpy()[urgent_mask].tolist()
+                )
+            ]
             
             return {
-                "total_products": len(all_products),
-                "products": all_products.tolist(),
+                "total_products": len(summary),
+                "products": summary.index.tolist(),
                 "urgent_items": urgent_items,
                 "total_urgent": len(urgent_items)
             }
@@ -415,13 +742,18 @@ class Database:
                 "reasoning": f"Product is fresh with {days_until_expiry} days until expiry"
             }
 
-import pandas as pd
-import pickle
-import os
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-import numpy as np
-from flask import jsonify
+_default_db = None
+_default_db_lock = threading.Lock()
+
+def get_default_database() -> Database:
+    """Return the process-wide Database shared by the chatbot and agents"""
+    global _default_db
+    if _default_db is None:
+        with _default_db_lock:
+            if _default_db is None:
+                _default_db = Database()
+    return _default_db
+
 from weather_service import weather_service
 
 def generate_mock_weather_data(days_ahead=7):
@@ -465,3 +797,61 @@ def convert_types(obj):
     else:
         return obj
 
+def pearson_correlation(a: np.ndarray, b: np.ndarray) -> float:
+    """Pearson correlation over the pairs where both values are present"""
+    valid = ~(np.isnan(a) | np.isnan(b))
+    if valid.sum() < 2:
+        return np.nan
+    
+    a_centered = a[valid] - a[valid].mean()
+    b_centered = b[valid] - b[valid].mean()
+    denominator = np.sqrt((a_centered @ a_centered) * (b_centered @ b_centered))
+    if denominator == 0:
+        return np.nan
+    return float(a_centered @ b_centered / denominator)
+
+def calculate_discount_inputs(sold: np.ndarray, wasted: np.ndarray,
+                              actual: np.ndarray, predicted: np.ndarray):
+    """
+    Vectorized waste rate and performance vs prediction (both in %).
+    Zero or NaN denominators are masked instead of branched on: waste rate
+    falls back to 0% and performance to 100%.
+    
+    Returns:
+        Tuple of (waste_rates, performances) arrays
+    """
+    total = sold + wasted
+    waste_rates = np.divide(wasted, total, out=np.zeros_like(total, dtype=np.float64), where=total > 0) * 100
+    performances = np.divide(actual, predicted, out=np.ones_like(actual, dtype=np.float64), where=predicted > 0) * 100
+    return waste_rates, performances
+
+def copy_prediction(prediction: Dict) -> Dict:
+    """Copy a forecast result; its per-day dicts hold only immutable values, so this matches a deepcopy"""
+    return {**prediction, 'predictions': [dict(day) for day in prediction['predictions']]}
+
+def classify_expiry_urgency(days_until_expiry: np.ndarray) -> np.ndarray:
+    """Inventory urgency label for each days-until-expiry value (see EXPIRY_URGENCY_BOUNDS)"""
+    return EXPIRY_URGENCY_LABELS[np.searchsorted(EXPIRY_URGENCY_BOUNDS, days_until_expiry, side='right')]
+
+def calculate_discounts(waste_rates: np.ndarray, performances: np.ndarray):
+    """
+    Vectorized discount decision for many products at once.
+    
+    Args:
+        waste_rates: Recent waste rate (%) per product
+        performances: Actual sales vs prediction (%) per product
+    
+    Returns:
+        Tuple of (needs_discount, discount_pct, urgency) arrays
+    """
+    needs_discount = (waste_rates > DISCOUNT_WASTE_TRIGGER_PCT) | (performances < DISCOUNT_PERFORMANCE_TRIGGER_PCT)
+    
+    # side='left' keeps boundaries in the lower tier (strictly greater moves up)
+    tiers = np.searchsorted(DISCOUNT_WASTE_THRESHOLDS, waste_rates, side='left')
+    discounts = DISCOUNT_TIER_PCT[tiers]
+    urgencies = DISCOUNT_TIER_URGENCY[tiers]
+    
+    discounts = np.where(needs_discount, discounts, 0)
+    urgencies = np.where(needs_discount, urgencies, "none")
+    
+    return needs_discount, discounts, urgencies
@@ -1,10 +1,34 @@
-import json
+import copy
+import hashlib
+import orjson
 import os
 import requests
-from typing import Dict, Any, Optional
-from dotenv import load_dotenv
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Any, Iterator, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-load_dotenv()
+# .env is a development convenience; deployments (APP_ENV != dev) set the environment directly
+if os.getenv('APP_ENV', 'dev') == 'dev':
+    from dotenv import load_dotenv
+    load_dotenv()
+
+# Identical low-temperature prompts reuse a recent response instead of calling Gemini
+RESPONSE_CACHE_TTL = 300
+RESPONSE_CACHE_MAXSIZE = 2048
+RESPONSE_CACHE_MAX_TEMPERATURE = 0.5
+
+# Keep-alive connections to the Gemini API, shared by concurrent requests
+HTTP_POOL_CONNECTIONS = 10
+HTTP_POOL_MAXSIZE = 20
+HTTP_MAX_RETRIES = 3
+
+# In-flight Gemini requests per client; extra callers wait for a pooled connection
+MAX_CONCURRENT_REQUESTS = HTTP_POOL_MAXSIZE
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
 
 class GeminiClient:
     """Reusable client for Gemini REST API"""
@@ -16,6 +40,40 @@ class GeminiClient:
         
         self.base_url = "https://generativelanguage.googleapis.com/v1beta/models"
         self.model = "gemini-2.5-flash"
+        self._generate_url = f"{self.base_url}/{self.model}:generateContent"
+        self._stream_url = f"{self.base_url}/{self.model}:streamGenerateContent"
+        
+        # Reuse TCP/TLS connections instead of handshaking on every call
+        self.session = requests.Session()
+        retries = Retry(
+            total=HTTP_MAX_RETRIES,
+            backoff_factor=0.2,
+            status_forcelist=HTTP_RETRY_STATUSES,
+            allowed_methods=frozenset(["POST"])
+        )
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retries)
+        self.session.mount("https://", adapter)
+        # Payloads are serialized with orjson, so the JSON content type is set once here
+        self.session.headers["Content-Type"] = "application/json"
+        self._request_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+        
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        # Entries hold a Future, so callers arriving while a request is on the wire share it
+        self._coalesced = 0
+    
+    def get_session(self) -> requests.Session:
+        """Pooled HTTP session used for all Gemini calls (e.g. to mount custom adapters)"""
+        return self.session
+    
+    def warm_up(self, timeout: float = 5):
+        """Open a pooled TLS connection to the API host ahead of the first real request"""
+        try:
+            self.session.head(self.base_url, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"Gemini connection warm-up failed: {e}")
     
     def generate(
         self, 
@@ -23,12 +81,156 @@ class GeminiClient:
         system_instruction: str = "You are a helpful assistant.",
         response_schema: Optional[Dict] = None,
         temperature: float = 0.7,
-        timeout: int = 30
+        timeout: int = 30,
+        cache: Optional[bool] = None
     ) -> Dict[str, Any]:
-        """Generate response from Gemini"""
+        """
+        Generate response from Gemini.
+        Responses for prompts at or below RESPONSE_CACHE_MAX_TEMPERATURE are
+        reused for RESPONSE_CACHE_TTL seconds, and identical requests made while
+        one is in flight wait for it instead of calling the API again; pass
+        cache=True to cache at any temperature or cache=False to always call the API.
+        """
+        
+        payload = self._build_payload(user_prompt, system_instruction, response_schema, temperature)
+        
+        use_cache = temperature <= RESPONSE_CACHE_MAX_TEMPERATURE if cache is None else cache
+        if not use_cache:
+            return self._post_generate(payload, response_schema, timeout)
+        
+        cache_key = self._cache_key(user_prompt, system_instruction, response_schema, temperature)
+        pending, is_leader = self._cache_claim(cache_key)
+        if not is_leader:
+            return copy.deepcopy(pending.result())
+        
+        try:
+            generated = self._post_generate(payload, response_schema, timeout)
+        except BaseException as e:
+            self._cache_resolve(cache_key, pending, None)
+            pending.set_exception(e)
+            raise
         
-        api_url = f"{self.base_url}/{self.model}:generateContent?key={self.api_key}"
+        self._cache_resolve(cache_key, pending, None if "error" in generated else generated)
+        pending.set_result(copy.deepcopy(generated))
+        return generated
+    
+    def _post_generate(self, payload: Dict, response_schema: Optional[Dict], timeout: int) -> Dict[str, Any]:
+        """Call generateContent and parse the reply, returning {"error": ...} on failure"""
+        try:
+            with self._request_slots:
+                response = self.session.post(self._generate_url, params={"key": self.api_key}, data=orjson.dumps(payload), timeout=timeout)
+            response.raise_for_status()
+            
+            result = orjson.loads(response.content)
+            response_text = result["candidates"][0]["content"]["parts"][0]["text"]
+            
+            if response_schema:
+                generated = orjson.loads(response_text)
+            else:
+                generated = {"response": response_text}
+            
+        except Exception as e:
+            return {"error": f"Request failed: {str(e)}"}
         
+        return generated
+    
+    def clear_cache(self):
+        """Drop all cached Gemini responses"""
+        with self._cache_lock:
+            self._cache.clear()
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Response cache size, hit/miss counts and coalesced in-flight calls since startup"""
+        with self._cache_lock:
+            lookups = self._cache_hits + self._cache_misses
+            in_flight = sum(1 for entry in self._cache.values() if entry['timestamp'] is None)
+            return {
+                "size": len(self._cache) - in_flight,
+                "hits": self._cache_hits,
+                "misses": self._cache_misses,
+                "hit_rate": round(self._cache_hits / lookups, 3) if lookups else 0.0,
+                "coalesced": self._coalesced,
+                "in_flight": in_flight
+            }
+    
+    @staticmethod
+    def _cache_key(user_prompt: str, system_instruction: str,
+                   response_schema: Optional[Dict], temperature: float) -> bytes:
+        """Content hash identifying a generation request (temperature bucketed to 0.1)"""
+        schema = orjson.dumps(response_schema, option=orjson.OPT_SORT_KEYS).decode() if response_schema else ""
+        key_source = f"{system_instruction}\0{user_prompt}\0{schema}\0{round(temperature, 1)}"
+        return hashlib.blake2b(key_source.encode(), digest_size=16).digest()
+    
+    def _cache_claim(self, key: bytes):
+        """
+        Return (future, is_leader) for a request. A fresh or pending entry is
+        shared; otherwise a new pending entry is stored and the caller must
+        resolve it with _cache_resolve.
+        """
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                if entry['timestamp'] is None:
+                    self._coalesced += 1
+                    return entry['future'], False
+                if time.monotonic() - entry['timestamp'] < RESPONSE_CACHE_TTL:
+                    self._cache_hits += 1
+                    self._cache.move_to_end(key)
+                    return entry['future'], False
+            self._cache_misses += 1
+            future = Future()
+            self._cache[key] = {'future': future, 'timestamp': None}
+            self._cache.move_to_end(key)
+            return future, True
+    
+    def _cache_resolve(self, key: bytes, future: Future, data: Optional[Dict[str, Any]]):
+        """Keep a pending entry once its response arrives (data=None drops it), evicting the least recently used when full"""
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None or entry['future'] is not future:
+                return
+            if data is None:
+                del self._cache[key]
+                return
+            entry['timestamp'] = time.monotonic()
+            while len(self._cache) > RESPONSE_CACHE_MAXSIZE:
+                self._cache.popitem(last=False)
+    
+    def generate_text_stream(
+        self,
+        user_prompt: str,
+        system_instruction: str = "",
+        temperature: float = 0.7,
+        timeout: int = 30
+    ) -> Iterator[str]:
+        """
+        Stream text generation, yielding chunks as Gemini produces them.
+        Raises on request failure, like generate_text.
+        """
+        payload = self._build_payload(user_prompt, system_instruction, None, temperature)
+        params = {"alt": "sse", "key": self.api_key}
+        
+        with self._request_slots, self.session.post(self._stream_url, params=params, data=orjson.dumps(payload), timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            
+            # Server-Sent Events: each "data:" line holds one partial response
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                
+                chunk = orjson.loads(line[len("data:"):])
+                for part in chunk.get("candidates", [{}])[0].get("content", {}).get("parts", []):
+                    if part.get("text"):
+                        yield part["text"]
+    
+    def _build_payload(
+        self,
+        user_prompt: str,
+        system_instruction: str,
+        response_schema: Optional[Dict],
+        temperature: float
+    ) -> Dict[str, Any]:
+        """Build the request body shared by regular and streaming calls"""
         payload = {
             "system_instruction": {
                 "parts": [{"text": system_instruction}]
@@ -45,26 +247,54 @@ class GeminiClient:
             payload["generationConfig"]["responseMimeType"] = "application/json"
             payload["generationConfig"]["responseSchema"] = response_schema
         
-        try:
-            response = requests.post(api_url, json=payload, timeout=timeout)
-            response.raise_for_status()
-            
-            result = response.json()
-            response_text = result["candidates"][0]["content"]["parts"][0]["text"]
-            
-            if response_schema:
-                return json.loads(response_text)
-            else:
-                return {"response": response_text}
-            
-        except Exception as e:
-            return {"error": f"Request failed: {str(e)}"}
+        return payload
     
-    def generate_text(self, user_prompt: str, system_instruction: str = "", temperature: float = 0.7) -> str:
-        """Simple text generation"""
-        result = self.generate(user_prompt, system_instruction, temperature=temperature)
+    def generate_text(self, user_prompt: str, system_instruction: str = "", temperature: float = 0.7,
+                      cache: Optional[bool] = None) -> str:
+        """Simple text generation (cache follows generate's rules)"""
+        result = self.generate(user_prompt, system_instruction, temperature=temperature, cache=cache)
         
         if "error" in result:
             raise Exception(result["error"])
         
         return result.get("response", "")
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_default_gemini_client() -> GeminiClient:
+    """Return the process-wide GeminiClient shared by the chatbot and agents"""
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = GeminiClient()
+    return _default_client
+
+def format_for_llm(data: Any) -> str:
+    """
+    Serialize prompt context compactly for Gemini.
+    Drops empty values, rounds floats inside record lists to 1 decimal,
+    and emits JSON without indentation to keep token counts down.
+    """
+    return orjson.dumps(
+        _compact(data),
+        default=str,
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    ).decode()
+
+def _compact(obj: Any, in_list: bool = False) -> Any:
+    """Recursively strip None/empty values and round list floats"""
+    if isinstance(obj, dict):
+        compacted = {k: _compact(v, in_list) for k, v in obj.items()}
+        return {
+            k: v for k, v in compacted.items()
+            if v is not None and not (isinstance(v, (list, dict)) and not v)
+        }
+    elif isinstance(obj, (list, tuple)):
+        return [_compact(v, True) for v in obj]
+    elif isinstance(obj, float) and in_list:
+        return round(obj, 1)
+    else:
+        return obj
@@ -3,41 +3,125 @@ EcoPredict Backend API
 Flask API server for demand forecasting
 """
 
+import gzip
+import hashlib
+import orjson
 import uuid
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import pandas as pd
-import pickle
 import os
+import threading
 from datetime import datetime, timedelta
 import numpy as np
+from typing import Optional
 from chatbot import WasteLessChatbot
+from session_store import SessionStore
 
 chatbot = WasteLessChatbot()
-sessions = {}
+sessions = SessionStore()
+
+# Warm the Prophet models in the background so startup isn't blocked on unpickling
+threading.Thread(target=chatbot.db.preload_models, daemon=True).start()
+# Likewise pay the Gemini TLS handshake up front rather than on the first chat message
+threading.Thread(target=chatbot.gemini.warm_up, daemon=True).start()
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson, which also serializes stray numpy values"""
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return self._dumps_bytes(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumps_bytes(obj), mimetype=self.mimetype)
+    
+    @staticmethod
+    def _dumps_bytes(obj) -> bytes:
+        return orjson.dumps(
+            obj,
+            default=DefaultJSONProvider.default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
 # Configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODELS_DIR = os.path.join(BASE_DIR, 'models')
 DATA_DIR = os.path.join(BASE_DIR, 'data')
+SALES_FILE = os.path.join(DATA_DIR, 'daily_sales_dataset.csv')
+
+# Demo waste figures on the dashboard: (base, cycle length) per product
+DEMO_WASTE_PATTERN = {
+    'Strawberries': (8, 4),
+    'Chocolate': (11, 4),
+    'Eggs': (14, 7),
+    'Milk': (18, 7)
+}
+DEFAULT_DEMO_WASTE = (9, 6)
+
+# Forecast horizons (days) accepted by the forecast endpoints
+MIN_FORECAST_DAYS = 1
+MAX_FORECAST_DAYS = 30
+
+# Parsed CSVs keyed by path, reloaded only when the file's mtime changes
+_csv_cache = {}
+_csv_cache_lock = threading.Lock()
+_products_cache = (None, [])
+
+# Dashboard predictions are static between training runs; browsers may reuse them this long
+DASHBOARD_MAX_AGE = 3600
+# predictions.csv records grouped by product, rebuilt only when the file changes
+_product_predictions_cache = (None, {})
+# Serialized /api/predictions/all body, rebuilt only when predictions.csv changes
+_dashboard_cache = (None, None)
+
+
+def load_csv(path: str) -> pd.DataFrame:
+    """Read a CSV once and reuse the frame until the file changes (treat it as read-only)"""
+    mtime = os.stat(path).st_mtime
+    cached = _csv_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    
+    with _csv_cache_lock:
+        cached = _csv_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, pd.read_csv(path))
+            _csv_cache[path] = cached
+    return cached[1]
+
+
+def load_products() -> list:
+    """Product names from the sales CSV, recomputed only when the file changes"""
+    global _products_cache
+    df = load_csv(SALES_FILE)
+    if _products_cache[0] is not df:
+        _products_cache = (df, df['product'].unique().tolist())
+    return _products_cache[1]
 
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'message': 'EcoPredict API is running'})
+    return jsonify({
+        'status': 'healthy',
+        'message': 'EcoPredict API is running',
+        'llm_cache': chatbot.gemini.cache_stats()
+    })
 
 @app.route('/api/products', methods=['GET'])
 def get_products():
     """Get list of available products"""
     try:
-        # Load sales data to get product list
-        sales_file = os.path.join(DATA_DIR, 'daily_sales_dataset.csv')
-        df = pd.read_csv(sales_file)
-        products = df['product'].unique().tolist()
+        products = load_products()
         
         return jsonify({
             'products': products,
@@ -46,6 +130,18 @@ def get_products():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def load_product_predictions(predictions_file: str) -> dict:
+    """Prediction records keyed by product, so lookups skip a string compare over every row"""
+    global _product_predictions_cache
+    df = load_csv(predictions_file)
+    if _product_predictions_cache[0] is not df:
+        _product_predictions_cache = (df, {
+            product: product_df.to_dict('records')
+            for product, product_df in df.groupby('product', sort=False)
+        })
+    return _product_predictions_cache[1]
+
+
 @app.route('/api/predictions/<product_name>', methods=['GET'])
 def get_predictions(product_name):
     """Get predictions for a specific product"""
@@ -53,56 +149,77 @@ def get_predictions(product_name):
         # Load predictions from CSV
         predictions_file = os.path.join(BASE_DIR, 'output', 'predictions.csv')
         if os.path.exists(predictions_file):
-            df = pd.read_csv(predictions_file)
-            product_predictions = df[df['product'] == product_name].to_dict('records')
+            product_predictions = load_product_predictions(predictions_file).get(product_name, [])
             return jsonify({'predictions': product_predictions})
         else:
             return jsonify({'error': 'Predictions file not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def format_dashboard_predictions(df: pd.DataFrame) -> dict:
+    """First week of predictions per product, shaped for the dashboard charts"""
+    first_week = df.groupby('product', sort=False).head(7)
+    dates = pd.to_datetime(first_week['date'], format='%Y-%m-%d', cache=True).dt.strftime('%b %d').to_numpy()
+    predicted = first_week['predicted_demand'].to_numpy().astype(int)
+    lower = first_week['lower_bound'].to_numpy().astype(int)
+    upper = first_week['upper_bound'].to_numpy().astype(int)
+    products = first_week['product'].to_numpy()
+    day_index = first_week.groupby('product', sort=False).cumcount().to_numpy()
+    
+    # Keep hardcoded waste and total for demonstration as requested;
+    # look the pattern up once per product and broadcast it to that product's rows
+    codes, unique_products = pd.factorize(products)
+    pattern = np.array([DEMO_WASTE_PATTERN.get(product, DEFAULT_DEMO_WASTE) for product in unique_products]).reshape(-1, 2)
+    base, mod = pattern[codes].T
+    waste = base + day_index % mod
+    total = predicted + waste
+    
+    formatted_data = {product: [] for product in df['product'].unique()}
+    for product, date_str, pred, low, high, wasted, tot in zip(
+        products, dates, predicted.tolist(), lower.tolist(), upper.tolist(), waste.tolist(), total.tolist()
+    ):
+        formatted_data[product].append({
+            'date': date_str,
+            'predicted': pred,
+            'lower': low,
+            'upper': high,
+            'waste': wasted,
+            'total': tot
+        })
+    return formatted_data
+
+
+def load_dashboard_payload(predictions_file: str) -> dict:
+    """Serialized dashboard body (plain and gzipped) with its ETag, recomputed only when the CSV changes"""
+    global _dashboard_cache
+    df = load_csv(predictions_file)
+    if _dashboard_cache[0] is not df:
+        body = orjson.dumps({'predictions': format_dashboard_predictions(df)})
+        _dashboard_cache = (df, {
+            'body': body,
+            'gzip': gzip.compress(body),
+            'etag': hashlib.blake2b(body, digest_size=16).hexdigest()
+        })
+    return _dashboard_cache[1]
+
+
 @app.route('/api/predictions/all', methods=['GET'])
 def get_all_predictions():
     """Get all predictions formatted for dashboard"""
     try:
         predictions_file = os.path.join(BASE_DIR, 'output', 'predictions.csv')
         if os.path.exists(predictions_file):
-            df = pd.read_csv(predictions_file)
+            payload = load_dashboard_payload(predictions_file)
             
-            # Group by product and format for dashboard
-            formatted_data = {}
-            for product in df['product'].unique():
-                product_data = df[df['product'] == product].head(7)  # First 7 days
-                
-                formatted_product_data = []
-                for _, row in product_data.iterrows():
-                    # Parse date and format as "Jan 1", "Jan 2", etc.
-                    date_obj = pd.to_datetime(row['date'])
-                    formatted_date = date_obj.strftime('%b %d')
-                    
-                    formatted_product_data.append({
-                        'date': formatted_date,
-                        'predicted': int(row['predicted_demand']),
-                        'lower': int(row['lower_bound']),
-                        'upper': int(row['upper_bound']),
-                        # Keep hardcoded waste and total for demonstration as requested
-                        'waste': 8 + len(formatted_product_data) % 4 if product == 'Strawberries' else
-                                11 + len(formatted_product_data) % 4 if product == 'Chocolate' else
-                                14 + len(formatted_product_data) % 7 if product == 'Eggs' else
-                                18 + len(formatted_product_data) % 7 if product == 'Milk' else
-                                9 + len(formatted_product_data) % 6,
-                        'total': int(row['predicted_demand']) + (
-                            8 + len(formatted_product_data) % 4 if product == 'Strawberries' else
-                            11 + len(formatted_product_data) % 4 if product == 'Chocolate' else
-                            14 + len(formatted_product_data) % 7 if product == 'Eggs' else
-                            18 + len(formatted_product_data) % 7 if product == 'Milk' else
-                            9 + len(formatted_product_data) % 6
-                        )
-                    })
-                
-                formatted_data[product] = formatted_product_data
-            
-            return jsonify({'predictions': formatted_data})
+            use_gzip = 'gzip' in request.accept_encodings
+            response = Response(payload['gzip'] if use_gzip else payload['body'], mimetype='application/json')
+            if use_gzip:
+                response.headers['Content-Encoding'] = 'gzip'
+            response.headers['Vary'] = 'Accept-Encoding'
+            response.cache_control.public = True
+            response.cache_control.max_age = DASHBOARD_MAX_AGE
+            response.set_etag(payload['etag'])
+            return response.make_conditional(request)
         else:
             return jsonify({'error': 'Predictions file not found'}), 404
     except Exception as e:
@@ -114,7 +231,7 @@ def get_metrics():
     try:
         metrics_file = os.path.join(BASE_DIR, 'output', 'validation_metrics.csv')
         if os.path.exists(metrics_file):
-            df = pd.read_csv(metrics_file)
+            df = load_csv(metrics_file)
             metrics = df.to_dict('records')
             return jsonify({'metrics': metrics})
         else:
@@ -122,6 +239,61 @@ def get_metrics():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _validate_forecast_days(days) -> Optional[str]:
+    """Error message if days is not an integer horizon the forecast endpoints accept, else None"""
+    if isinstance(days, bool) or not isinstance(days, int):
+        return 'days must be an integer'
+    if not MIN_FORECAST_DAYS <= days <= MAX_FORECAST_DAYS:
+        return f'days must be between {MIN_FORECAST_DAYS} and {MAX_FORECAST_DAYS}'
+    return None
+
+def _forecast_product(product_name: str, days_ahead: int = 30):
+    """Forecast demand for one product with default weather, or None if it has no model"""
+    # Shared, already-loaded model instead of unpickling per request
+    model = chatbot.db.get_model(product_name)
+    if model is None:
+        return None
+    
+    # Generate future dates
+    future_dates = pd.date_range(
+        start=datetime.now(),
+        periods=days_ahead
+    )
+    
+    # Create future dataframe with default values
+    future = pd.DataFrame({
+        'ds': future_dates,
+        'is_weekend': (future_dates.dayofweek.to_numpy() >= 5).view(np.int8),
+        'is_holiday': np.zeros(days_ahead, dtype=np.int8),
+        'temperature': np.full(days_ahead, 20.0, dtype=np.float32),  # Default temperature
+        'precipitation': np.zeros(days_ahead, dtype=np.float32)   # Default precipitation
+    })
+    
+    # Generate predictions
+    forecast = model.predict(future)
+    
+    # Format response from whole columns rather than iterating rows
+    predictions = [
+        {
+            'date': date_str,
+            'predicted_demand': round(yhat),
+            'lower_bound': round(lower),
+            'upper_bound': round(upper)
+        }
+        for date_str, yhat, lower, upper in zip(
+            forecast['ds'].dt.strftime('%Y-%m-%d'),
+            forecast['yhat'].tolist(),
+            forecast['yhat_lower'].tolist(),
+            forecast['yhat_upper'].tolist()
+        )
+    ]
+    
+    return {
+        'product': product_name,
+        'predictions': predictions,
+        'generated_at': datetime.now().isoformat()
+    }
+
 @app.route('/api/forecast', methods=['POST'])
 def generate_forecast():
     """Generate new forecast for a product"""
@@ -133,45 +305,43 @@ def generate_forecast():
         if not product_name:
             return jsonify({'error': 'Product name is required'}), 400
         
-        # Load model
-        model_file = os.path.join(MODELS_DIR, f'{product_name.replace(" ", "_")}_model.pkl')
-        if not os.path.exists(model_file):
+        days_error = _validate_forecast_days(days_ahead)
+        if days_error:
+            return jsonify({'error': days_error}), 400
+        
+        result = _forecast_product(product_name, days_ahead)
+        if result is None:
             return jsonify({'error': f'Model for {product_name} not found'}), 404
         
-        with open(model_file, 'rb') as f:
-            model = pickle.load(f)
+        return jsonify(result)
         
-        # Generate future dates
-        future_dates = pd.date_range(
-            start=datetime.now(),
-            periods=days_ahead
-        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/forecast/batch', methods=['POST'])
+def generate_forecast_batch():
+    """Generate weather-aware forecasts for several products in one call"""
+    try:
+        data = request.get_json() or {}
+        products = data.get('products') or chatbot.db.get_all_products()
+        days_ahead = data.get('days', 7)
         
-        # Create future dataframe with default values
-        future = pd.DataFrame({
-            'ds': future_dates,
-            'is_weekend': [1 if d.dayofweek >= 5 else 0 for d in future_dates],
-            'is_holiday': [0] * days_ahead,
-            'temperature': [20] * days_ahead,  # Default temperature
-            'precipitation': [0] * days_ahead   # Default precipitation
-        })
+        if not isinstance(products, list) or not all(isinstance(product, str) for product in products):
+            return jsonify({'error': 'products must be a list of product names'}), 400
+        
+        days_error = _validate_forecast_days(days_ahead)
+        if days_error:
+            return jsonify({'error': days_error}), 400
         
-        # Generate predictions
-        forecast = model.predict(future)
+        unknown = sorted(set(products) - set(chatbot.db.get_all_products()))
+        if unknown:
+            return jsonify({'error': f"Unknown products: {', '.join(unknown)}"}), 400
         
-        # Format response
-        predictions = []
-        for i, row in forecast.iterrows():
-            predictions.append({
-                'date': row['ds'].strftime('%Y-%m-%d'),
-                'predicted_demand': round(row['yhat']),
-                'lower_bound': round(row['yhat_lower']),
-                'upper_bound': round(row['yhat_upper'])
-            })
+        # One weather fetch shared by all products, models predicted in parallel
+        forecasts = chatbot.db.get_prophet_prediction_many(products, days_ahead)
         
         return jsonify({
-            'product': product_name,
-            'predictions': predictions,
+            'forecasts': forecasts,
             'generated_at': datetime.now().isoformat()
         })
         
@@ -192,18 +362,15 @@ def chat():
     if not session_id:
         session_id = str(uuid.uuid4())
     
-    session_data = sessions.get(session_id, {"history": []})
+    session_data = sessions.get(session_id) or {"history": []}
     
     try:
         # Process message
         result = chatbot.handle_message(user_message, session_data)
         
-        # Update session history
-        session_data["history"].append({
-            "user": user_message,
-            "assistant": result["response"]
-        })
-        sessions[session_id] = session_data
+        # Update session history (bounded, older turns are summarized)
+        chatbot.record_turn(session_data, user_message, result["response"])
+        sessions.set(session_id, session_data)
         
         return jsonify({
             "response": result["response"],
@@ -214,6 +381,54 @@ def chat():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _sse_event(payload: dict) -> bytes:
+    """Encode one SSE data event straight to bytes, skipping the str round-trip"""
+    return b"data: " + OrjsonProvider._dumps_bytes(payload) + b"\n\n"
+
+def _sse_response(events):
+    """Wrap an SSE event generator so chunks reach the client as soon as they are yielded"""
+    def stream():
+        # Flush headers right away, before data gathering and the first Gemini token
+        yield b": stream open\n\n"
+        yield from events
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # Stop reverse proxies (e.g. nginx) from buffering the whole stream
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Handle chat messages, streaming the response as Server-Sent Events"""
+    data = request.json
+    user_message = data.get('message')
+    session_id = data.get('session_id') or str(uuid.uuid4())
+    
+    if not user_message:
+        return jsonify({"error": "Message is required"}), 400
+    
+    session_data = sessions.get(session_id) or {"history": []}
+    
+    def generate():
+        chunks = []
+        try:
+            for chunk in chatbot.handle_message_stream(user_message, session_data):
+                chunks.append(chunk)
+                yield _sse_event({'text': chunk})
+            
+            chatbot.record_turn(session_data, user_message, "".join(chunks))
+            sessions.set(session_id, session_data)
+            yield _sse_event({'done': True, 'session_id': session_id})
+        except Exception as e:
+            yield _sse_event({'error': str(e)})
+    
+    return _sse_response(generate())
+
 @app.route('/api/chat/greeting', methods=['GET'])
 def get_greeting():
     """Get proactive greeting message"""
@@ -223,5 +438,19 @@ def get_greeting():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/chat/greeting/stream', methods=['GET'])
+def get_greeting_stream():
+    """Stream the proactive greeting as Server-Sent Events"""
+    def generate():
+        try:
+            for chunk in chatbot.get_proactive_greeting_stream():
+                yield _sse_event({'text': chunk})
+            yield _sse_event({'done': True})
+        except Exception as e:
+            yield _sse_event({'error': str(e)})
+    
+    return _sse_response(generate())
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=8000)
+    # Each request gets its own thread, so slow Gemini calls don't block other users
+    app.run(debug=True, host='0.0.0.0', port=8000, threaded=True)
@@ -1,13 +1,45 @@
-from gemini_client import GeminiClient
-from database import Database
-import json
+from gemini_client import GeminiClient, get_default_gemini_client, format_for_llm
+from database import Database, get_default_database
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import random
+import re
+import threading
+import time
+
+# Upper bound on concurrent (product, data type) lookups
+MAX_GATHER_WORKERS = 16
+# Parsed product lists remembered per (message, catalog); oldest entries are evicted first
+EXTRACT_CACHE_SIZE = 1024
+# Earlier replies are clipped to this many characters in the prompt; the data block carries the numbers
+HISTORY_CHARS_PER_TURN = 400
+# How often (seconds) the cached product catalog is refreshed
+PRODUCTS_REFRESH_SECONDS = 60
+# Messages asking about the whole store resolve to ['all'] without a Gemini call
+ALL_PRODUCTS_PATTERN = re.compile(r"\b(all|everything|every product)\b", re.IGNORECASE)
+
+# Static system instruction shared by every unified response, kept byte-identical across calls
+UNIFIED_SYSTEM_PROMPT = """You are WasteLess assistant handling ALL aspects of grocery inventory management.
+
+        You have access to:
+        - Current inventory and expiration data
+        - Pricing and discount recommendations  
+        - Demand forecasts from Prophet ML model
+        - Historical sales trends
+        - Weather impact analysis
+
+        Respond naturally to questions about ANY of these topics. If conversation shifts topics, acknowledge it smoothly ("Regarding ordering..." or "As for pricing...").
+
+        Be specific, cite data, give clear recommendations."""
 
 class Orchestrator:
-    def __init__(self):
-        self.gemini = GeminiClient()
-        self.db = Database()
+    def __init__(self, gemini_client: GeminiClient = None, db: Database = None):
+        self.gemini = gemini_client or get_default_gemini_client()
+        self.db = db or get_default_database()
         self.webhook_url = "https://hook.us2.make.com/8oj18ng2vakhmea2lk9kgl0rgq2yyffo"
+        self._extract_cache = OrderedDict()
+        self._extract_cache_lock = threading.Lock()
+        self._refresh_products()
     
     def handle_query(self, user_message: str, session_data: dict = None) -> dict:
         # Get conversation history
@@ -32,50 +64,86 @@ class Orchestrator:
         """Get all data types for all products upfront"""
         # Handle 'all' keyword
         if 'all' in products:
-            products = self.db.get_all_products()
+            products = self._products()
+        
+        if not products:
+            return {}
+        
+        # Every (product, data type) lookup is independent model prediction or file/weather I/O,
+        # so fan all of them out at once instead of one product at a time
+        tasks = [(product, name, fetch) for product in products for name, fetch in self._data_fetchers()]
+        with ThreadPoolExecutor(max_workers=min(MAX_GATHER_WORKERS, len(tasks))) as executor:
+            futures = [executor.submit(fetch, product) for product, _, fetch in tasks]
         
-        data = {}
-        for product in products:
+        all_data = {product: {} for product in products}
+        for (product, name, _), future in zip(tasks, futures):
+            product_data = all_data[product]
+            if "error" in product_data:
+                continue
             try:
-                data[product] = {
-                    "inventory": self.db.get_inventory_status(product),
-                    "forecast": self.db.get_prophet_prediction(product, 7),
-                    "historical": self.db.get_sales_trend(product, 30),
-                    "weather": self.db.get_weather_correlation(product)
-                }
+                product_data[name] = future.result()
             except Exception as e:
-                data[product] = {"error": f"Error gathering data for {product}: {str(e)}"}
-        return data
+                all_data[product] = {"error": f"Error gathering data for {product}: {str(e)}"}
+        return all_data
+    
+    def _data_fetchers(self) -> list:
+        """(data type, fetch function) pairs gathered for each product"""
+        return [
+            ("inventory", self.db.get_inventory_status),
+            ("forecast", lambda product: self.db.get_prophet_prediction(product, 7)),
+            ("historical", lambda product: self.db.get_sales_trend(product, 30)),
+            ("weather", self.db.get_weather_correlation)
+        ]
     
     def _generate_unified_response(self, query: str, data: dict, history: list) -> str:
-        system = """You are WasteLess assistant handling ALL aspects of grocery inventory management.
-
-        You have access to:
-        - Current inventory and expiration data
-        - Pricing and discount recommendations  
-        - Demand forecasts from Prophet ML model
-        - Historical sales trends
-        - Weather impact analysis
+        # Most stable content first so consecutive turns share the longest prompt prefix,
+        # which Gemini 2.5 caches implicitly; the new question goes last
+        context = f"""Complete data:
+        {format_for_llm(data)}
 
-        Respond naturally to questions about ANY of these topics. If conversation shifts topics, acknowledge it smoothly ("Regarding ordering..." or "As for pricing...").
-
-        Be specific, cite data, give clear recommendations."""
-
-        context = f"""Conversation history:
-        {json.dumps(history, indent=2) if history else "First message"}
+        Conversation history:
+        {self._format_history(history) if history else "First message"}
 
         User: "{query}"
 
-        Complete data:
-        {json.dumps(data, indent=2)}
-
         Provide a helpful, data-driven response. Handle pricing questions, forecast questions, or both naturally."""
 
-        return self.gemini.generate_text(context, system, temperature=0.7)
+        # Same question over the same data within the cache TTL gets the same answer
+        return self.gemini.generate_text(context, UNIFIED_SYSTEM_PROMPT, temperature=0.7, cache=True)
+    
+    @staticmethod
+    def _format_history(history: list) -> str:
+        """Render recent turns as text only, clipping long replies to HISTORY_CHARS_PER_TURN"""
+        lines = []
+        for turn in history:
+            reply = str(turn.get("assistant", ""))
+            if len(reply) > HISTORY_CHARS_PER_TURN:
+                reply = reply[:HISTORY_CHARS_PER_TURN] + "..."
+            lines.append(f"User: {turn.get('user', '')}\nAssistant: {reply}")
+        return "\n".join(lines)
     
     def _extract_products(self, user_message: str) -> list:
-        """Extract product names from user message using Gemini"""
-        available_products = self.db.get_all_products()
+        """Extract product names from user message, asking Gemini only when no name matches directly"""
+        self._products()
+        available_products, products_lower = self._catalog
+        
+        # Fast path: most messages name products verbatim or ask about everything
+        if ALL_PRODUCTS_PATTERN.search(user_message):
+            return ['all']
+        message_lower = user_message.lower()
+        mentioned_products = [
+            product for product, product_lower in zip(available_products, products_lower)
+            if product_lower in message_lower
+        ]
+        if mentioned_products:
+            return mentioned_products
+        
+        cache_key = (user_message.strip().lower(), tuple(available_products))
+        with self._extract_cache_lock:
+            cached = self._extract_cache.get(cache_key)
+            if cached is not None:
+                self._extract_cache.move_to_end(cache_key)
+                return list(cached)
         
         prompt = f"""Extract product names from this message: "{user_message}"
         
@@ -100,23 +168,39 @@ class Orchestrator:
             try:
                 products = ast.literal_eval(result.strip())
                 if isinstance(products, list):
-                    return products
+                    return self._remember_extraction(cache_key, products)
             except:
                 pass
                 
-            # Fallback: check if any available products are mentioned
-            mentioned_products = []
-            message_lower = user_message.lower()
-            for product in available_products:
-                if product.lower() in message_lower:
-                    mentioned_products.append(product)
-            
-            return mentioned_products if mentioned_products else ['all']
+            # Fallback: nothing matched verbatim either, so treat it as a store-wide question
+            return self._remember_extraction(cache_key, ['all'])
             
         except Exception as e:
             print(f"Error extracting products: {e}")
             return ['all']
     
+    def _refresh_products(self):
+        """Reload the product catalog along with lowercase names used for matching"""
+        products = self.db.get_all_products()
+        # Swapped in as one tuple so concurrent readers never pair names from different catalogs
+        self._catalog = (products, [product.lower() for product in products])
+        self._all_products_refreshed = time.monotonic()
+    
+    def _products(self) -> list:
+        """Cached product catalog, refreshed every PRODUCTS_REFRESH_SECONDS"""
+        if time.monotonic() - self._all_products_refreshed > PRODUCTS_REFRESH_SECONDS:
+            self._refresh_products()
+        return self._catalog[0]
+    
+    def _remember_extraction(self, cache_key: tuple, products: list) -> list:
+        """Cache an extracted product list, evicting the oldest entries beyond EXTRACT_CACHE_SIZE"""
+        with self._extract_cache_lock:
+            self._extract_cache[cache_key] = tuple(products)
+            self._extract_cache.move_to_end(cache_key)
+            while len(self._extract_cache) > EXTRACT_CACHE_SIZE:
+                self._extract_cache.popitem(last=False)
+        return products
+    
     def get_proactive_greeting(self) -> str:
         """Return a warm, capability-focused greeting for the chat system."""
         import random
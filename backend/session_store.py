@@ -0,0 +1,51 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Idle sessions expire after this many seconds
+SESSION_TTL = 3600
+# Least recently used sessions are evicted beyond this many
+MAX_SESSIONS = 10000
+
+
+class SessionStore:
+    """
+    In-process chat session store with idle expiry and LRU eviction.
+    Keeps the get/set/delete surface small so a shared backend (e.g. Redis)
+    can replace it when the API runs with several workers.
+    """
+
+    def __init__(self, ttl: int = SESSION_TTL, max_sessions: int = MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str, default: Optional[Dict] = None) -> Optional[Dict]:
+        """Return the session's data, or default if it is unknown or expired"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return default
+            if time.monotonic() - entry['timestamp'] >= self.ttl:
+                del self._sessions[session_id]
+                return default
+            self._sessions.move_to_end(session_id)
+            return entry['data']
+
+    def set(self, session_id: str, data: Dict):
+        """Store the session's data, evicting the least recently used sessions when full"""
+        with self._lock:
+            self._sessions[session_id] = {'data': data, 'timestamp': time.monotonic()}
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id: str):
+        """Forget a session"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
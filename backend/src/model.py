@@ -6,10 +6,12 @@ Trains models for grocery store demand prediction using weather and sales data
 import pandas as pd
 import numpy as np
 from prophet import Prophet
-from sklearn.metrics import mean_absolute_error, mean_absolute_percentage_error
 import matplotlib.pyplot as plt
-import pickle
+import orjson
+import joblib
+from joblib import Parallel, delayed, parallel_config
 from datetime import datetime, timedelta
+import hashlib
 import os
 
 # ============================================================================
@@ -24,9 +26,26 @@ PROJECT_ROOT = os.path.dirname(BASE_DIR)
 WEATHER_FILE = os.path.join(PROJECT_ROOT, 'data', 'daily_weather_data.csv')
 SALES_FILE = os.path.join(PROJECT_ROOT, 'data', 'daily_sales_dataset.csv')
 
+# Narrow column types for the sales CSV; float32/int8 halve the bytes held per product frame
+SALES_DTYPES = {
+    'product': 'category',
+    'items_sold': 'int32',
+    'items_wasted': 'int32',
+    'temperature': 'float32',
+    'precipitation': 'float32',
+    'day_of_week': 'int8',
+    'is_weekend': 'int8',
+    'is_holiday': 'int8'
+}
+
 TRAIN_END_DATE = '2024-12-31'  # Adjust based on your data range
 OUTPUT_DIR = os.path.join(PROJECT_ROOT, 'models')
 PREDICTIONS_OUTPUT = os.path.join(PROJECT_ROOT, 'src', 'visualizations', 'predictions.csv')
+# Training charts (PNG), independent of the directory the script is run from
+VISUALIZATIONS_DIR = os.path.join(PROJECT_ROOT, 'visualizations')
+
+# Bump whenever train_prophet_model's settings change so cached models are refit
+MODEL_CONFIG_VERSION = 1
 
 # Products to train models for (None = all products)
 TARGET_PRODUCTS = ['Strawberries', 'Chocolate', 'Eggs', 'Milk', 'Hot-Dogs']
@@ -40,8 +59,7 @@ def load_and_merge_data():
     print("Loading data...")
     
     # Load sales data (weather data is already included in daily_sales_dataset.csv)
-    df = pd.read_csv(SALES_FILE)
-    df['date'] = pd.to_datetime(df['date'])
+    df = pd.read_csv(SALES_FILE, dtype=SALES_DTYPES, parse_dates=['date'], date_format='%Y-%m-%d')
     
     # Rename columns to match expected format
     df = df.rename(columns={
@@ -60,36 +78,32 @@ def load_and_merge_data():
     
     return df
 
-def prepare_product_data(df, product_name):
-    """Prepare data for a specific product for Prophet"""
-    
-    # Filter for specific product
-    product_df = df[df['product_name'] == product_name].copy()
+def prepare_product_data(df):
+    """Prepare Prophet data for every product with a single grouped aggregation"""
     
-    # Aggregate by date (in case there are multiple entries per day)
-    product_df = product_df.groupby('date').agg({
+    # Aggregate by product and date (in case there are multiple entries per day)
+    daily_df = df.groupby(['product_name', 'date'], as_index=False, sort=True, observed=True).agg({
         'quantity_sold': 'sum',
         'quantity_wasted': 'sum',
         'temperature_2m_mean': 'first',
         'precipitation_sum': 'first',
         'is_weekend': 'first',
         'is_holiday': 'first'
-    }).reset_index()
-    
-    # Sort by date
-    product_df = product_df.sort_values('date')
+    })
+    daily_df = daily_df.astype({'is_weekend': 'int8', 'is_holiday': 'int8'})
     
     # Prophet requires 'ds' (date) and 'y' (target variable) columns
-    prophet_df = pd.DataFrame({
-        'ds': product_df['date'],
-        'y': product_df['quantity_sold'],
-        'temperature': product_df['temperature_2m_mean'],
-        'precipitation': product_df['precipitation_sum'],
-        'is_weekend': product_df['is_weekend'].astype(int),
-        'is_holiday': product_df['is_holiday'].astype(int)
-    })
+    prophet_df = daily_df.rename(columns={
+        'date': 'ds',
+        'quantity_sold': 'y',
+        'temperature_2m_mean': 'temperature',
+        'precipitation_sum': 'precipitation'
+    })[['product_name', 'ds', 'y', 'temperature', 'precipitation', 'is_weekend', 'is_holiday']]
     
-    return prophet_df
+    return {
+        product_name: product_df.drop(columns='product_name').reset_index(drop=True)
+        for product_name, product_df in prophet_df.groupby('product_name', sort=False, observed=True)
+    }
 
 # ============================================================================
 # MODEL TRAINING
@@ -125,28 +139,61 @@ def train_prophet_model(train_df, product_name):
     
     return model
 
+def training_fingerprint(train_df):
+    """Hash of the training rows and model config; unchanged inputs reproduce the same fit"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(pd.util.hash_pandas_object(train_df, index=False).to_numpy().tobytes())
+    digest.update(f"|{MODEL_CONFIG_VERSION}".encode())
+    return digest.hexdigest()
+
+def load_cached_model(model_path, fingerprint):
+    """Return the saved model if it was trained on exactly these inputs, else None"""
+    meta_path = model_path.replace('.pkl', '.meta.json')
+    if not (os.path.exists(model_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path, 'rb') as f:
+        meta = orjson.loads(f.read())
+    if meta.get('fingerprint') != fingerprint:
+        return None
+    return joblib.load(model_path)
+
+def save_model(model, model_path, fingerprint):
+    """Save the model plus a sidecar recording what it was trained on"""
+    # Uncompressed joblib so the API can memory-map the fitted arrays
+    joblib.dump(model, model_path, compress=0)
+    meta = {
+        'fingerprint': fingerprint,
+        'config_version': MODEL_CONFIG_VERSION,
+        'trained_at': datetime.now().isoformat(timespec='seconds')
+    }
+    with open(model_path.replace('.pkl', '.meta.json'), 'wb') as f:
+        f.write(orjson.dumps(meta, option=orjson.OPT_INDENT_2))
+
 # ============================================================================
 # VALIDATION & METRICS
 # ============================================================================
 
-def validate_model(model, test_df, product_name):
-    """Validate model on test set and calculate metrics"""
+def validate_model(model, test_df, product_name, forecast=None):
+    """Validate model on test set and calculate metrics (reuses forecast if already predicted)"""
     
     print(f"\nValidating model for {product_name}...")
     
     # Make predictions on test set
-    forecast = model.predict(test_df)
+    if forecast is None:
+        forecast = model.predict(test_df)
     
-    # Calculate metrics
-    actual = test_df['y'].values
-    predicted = forecast['yhat'].values
+    # Calculate metrics directly on the arrays
+    actual = test_df['y'].to_numpy(dtype=np.float64)
+    predicted = forecast['yhat'].to_numpy(dtype=np.float64)
+    abs_error = np.abs(actual - predicted)
     
-    mae = mean_absolute_error(actual, predicted)
-    mape = mean_absolute_percentage_error(actual, predicted) * 100
+    mae = float(abs_error.mean())
+    # Same epsilon guard as sklearn's MAPE for zero-sale days
+    mape = float((abs_error / np.maximum(np.abs(actual), np.finfo(np.float64).eps)).mean() * 100)
     
     # Calculate baseline (naive forecast = historical average)
-    baseline_prediction = test_df['y'].mean()
-    baseline_mae = mean_absolute_error(actual, [baseline_prediction] * len(actual))
+    baseline_prediction = actual.mean()
+    baseline_mae = float(np.abs(actual - baseline_prediction).mean())
     
     improvement = ((baseline_mae - mae) / baseline_mae) * 100
     
@@ -168,6 +215,14 @@ def validate_model(model, test_df, product_name):
 # VISUALIZATION
 # ============================================================================
 
+def _save_figure(filename):
+    """Save the current figure under VISUALIZATIONS_DIR and close it"""
+    os.makedirs(VISUALIZATIONS_DIR, exist_ok=True)
+    path = os.path.join(VISUALIZATIONS_DIR, filename)
+    plt.savefig(path, dpi=300, bbox_inches='tight')
+    plt.close()
+    return path
+
 def create_visualizations(model, train_df, test_df, forecast, product_name):
     """Create visualization plots for model performance"""
     
@@ -191,7 +246,7 @@ def create_visualizations(model, train_df, test_df, forecast, product_name):
     
     # Plot 2: Residuals
     ax2 = axes[0, 1]
-    residuals = test_df['y'].values - forecast['yhat'].values
+    residuals = test_df['y'].to_numpy(dtype=np.float64) - forecast['yhat'].to_numpy()
     ax2.scatter(forecast['yhat'], residuals, alpha=0.6)
     ax2.axhline(y=0, color='r', linestyle='--')
     ax2.set_xlabel('Predicted Values')
@@ -201,7 +256,7 @@ def create_visualizations(model, train_df, test_df, forecast, product_name):
     
     # Plot 3: Components (Trend + Seasonality)
     ax3 = axes[1, 0]
-    # Create future dataframe for full visualization
+    # Create future dataframe for full visualization: training history plus 30 days
     future = model.make_future_dataframe(periods=30)
     future['temperature'] = train_df['temperature'].mean()
     future['precipitation'] = train_df['precipitation'].mean()
@@ -232,12 +287,8 @@ def create_visualizations(model, train_df, test_df, forecast, product_name):
     plt.tight_layout()
     
     # Save figure
-    if not os.path.exists('visualizations'):
-        os.makedirs('visualizations')
-    plt.savefig(f'visualizations/{product_name.replace(" ", "_")}_analysis.png', dpi=300, bbox_inches='tight')
-    print(f"Saved visualization to: visualizations/{product_name.replace(' ', '_')}_analysis.png")
-    
-    plt.close()
+    path = _save_figure(f'{product_name.replace(" ", "_")}_analysis.png')
+    print(f"Saved visualization to: {path}")
 
 def create_data_visualization(train_df, test_df, product_name):
     """Create visualization of the actual train and test data"""
@@ -262,12 +313,8 @@ def create_data_visualization(train_df, test_df, product_name):
     plt.grid(True, alpha=0.3)
     
     # Save figure
-    if not os.path.exists('visualizations'):
-        os.makedirs('visualizations')
-    plt.savefig(f'visualizations/{product_name.replace(" ", "_")}_data.png', dpi=300, bbox_inches='tight')
-    print(f"Saved data visualization to: visualizations/{product_name.replace(' ', '_')}_data.png")
-    
-    plt.close()
+    path = _save_figure(f'{product_name.replace(" ", "_")}_data.png')
+    print(f"Saved data visualization to: {path}")
 
 # ============================================================================
 # FUTURE PREDICTIONS
@@ -287,10 +334,10 @@ def generate_future_predictions(model, train_df, product_name, days_ahead=30):
     # Include all regressors that model was trained on
     future = pd.DataFrame({
         'ds': future_dates,
-        'is_weekend': [1 if d.dayofweek >= 5 else 0 for d in future_dates],
-        'is_holiday': [0] * days_ahead,  # Assume no holidays in next 7 days
-        'temperature': [train_df['temperature'].mean()] * days_ahead,  # Use historical average
-        'precipitation': [train_df['precipitation'].mean()] * days_ahead  # Use historical average
+        'is_weekend': (future_dates.dayofweek.to_numpy() >= 5).view(np.int8),
+        'is_holiday': np.zeros(days_ahead, dtype=np.int8),  # Assume no holidays in next 7 days
+        'temperature': np.full(days_ahead, train_df['temperature'].mean()),  # Use historical average
+        'precipitation': np.full(days_ahead, train_df['precipitation'].mean())  # Use historical average
     })
     
     # Generate predictions
@@ -314,6 +361,60 @@ def generate_future_predictions(model, train_df, product_name, days_ahead=30):
 # MAIN EXECUTION
 # ============================================================================
 
+def process_product(product, product_df):
+    """
+    Train, validate and save the model for one product.
+    
+    Returns:
+        Tuple of (validation metrics or None, future predictions or None)
+    """
+    try:
+        if product_df is None:
+            raise ValueError(f"No sales data for {product}")
+        
+        # Split into train/test (chronological)
+        train = product_df[product_df['ds'] <= TRAIN_END_DATE]
+        test = product_df[product_df['ds'] > TRAIN_END_DATE]
+        
+        print(f"\nTrain set: {len(train)} days ({train['ds'].min()} to {train['ds'].max()})")
+        print(f"Test set: {len(test)} days ({test['ds'].min()} to {test['ds'].max()})")
+        
+        # Create data visualization (train/test split)
+        create_data_visualization(train, test, product)
+        
+        # Train model, unless the saved one was fit on identical data and settings
+        model_path = os.path.join(OUTPUT_DIR, f'{product.replace(" ", "_")}_model.pkl')
+        fingerprint = training_fingerprint(train)
+        model = load_cached_model(model_path, fingerprint)
+        if model is None:
+            model = train_prophet_model(train, product)
+            # Save model here so the fitted model never has to travel back to the parent process
+            save_model(model, model_path, fingerprint)
+            print(f"Model saved to: {model_path}")
+        else:
+            print(f"\nTraining data unchanged for {product}; reusing {model_path}")
+        
+        # Validate on test set
+        metrics = None
+        if len(test) > 0:
+            # Predict the test period once for both metrics and plots
+            forecast = model.predict(test)
+            metrics = validate_model(model, test, product, forecast)
+            
+            # Create visualizations
+            create_visualizations(model, train, test, forecast, product)
+        else:
+            print(f"Warning: No test data available for {product}")
+        
+        # Generate future predictions
+        predictions = generate_future_predictions(model, train, product)
+        
+        return metrics, predictions
+        
+    except Exception as e:
+        print(f"Error processing {product}: {str(e)}")
+        return None, None
+
 def main():
     """Main execution function"""
     
@@ -334,53 +435,21 @@ def main():
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
     
+    # Prepare data for all products at once
+    product_frames = prepare_product_data(df)
+    
+    # Prophet fits are CPU-bound, so train products in separate worker processes;
+    # each worker only receives its own product's frame
+    n_jobs = max(1, min(len(products), os.cpu_count() or 1))
+    # One BLAS/OpenMP thread per worker so concurrent fits don't oversubscribe the cores
+    with parallel_config(backend='loky', inner_max_num_threads=1):
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(process_product)(product, product_frames.get(product)) for product in products
+        )
+    
     # Store metrics for all products
-    all_metrics = []
-    all_predictions = []
-    
-    # Process each product
-    for product in products:
-        try:
-            # Prepare data
-            product_df = prepare_product_data(df, product)
-            
-            # Split into train/test (chronological)
-            train = product_df[product_df['ds'] <= TRAIN_END_DATE]
-            test = product_df[product_df['ds'] > TRAIN_END_DATE]
-            
-            print(f"\nTrain set: {len(train)} days ({train['ds'].min()} to {train['ds'].max()})")
-            print(f"Test set: {len(test)} days ({test['ds'].min()} to {test['ds'].max()})")
-            
-            # Create data visualization (train/test split)
-            create_data_visualization(train, test, product)
-            
-            # Train model
-            model = train_prophet_model(train, product)
-            
-            # Validate on test set
-            if len(test) > 0:
-                metrics = validate_model(model, test, product)
-                all_metrics.append(metrics)
-                
-                # Create visualizations
-                forecast = model.predict(test)
-                create_visualizations(model, train, test, forecast, product)
-            else:
-                print(f"Warning: No test data available for {product}")
-            
-            # Generate future predictions
-            predictions = generate_future_predictions(model, train, product)
-            all_predictions.append(predictions)
-            
-            # Save model
-            model_path = os.path.join(OUTPUT_DIR, f'{product.replace(" ", "_")}_model.pkl')
-            with open(model_path, 'wb') as f:
-                pickle.dump(model, f)
-            print(f"Model saved to: {model_path}")
-            
-        except Exception as e:
-            print(f"Error processing {product}: {str(e)}")
-            continue
+    all_metrics = [metrics for metrics, _ in results if metrics is not None]
+    all_predictions = [predictions for _, predictions in results if predictions is not None]
     
     # Save summary metrics
     if all_metrics:
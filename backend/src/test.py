@@ -3,39 +3,57 @@ import os
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SALES_FILE = os.path.join(BASE_DIR, 'data', 'store_sales_2024.csv')
+PRODUCTS = ['Organic Strawberries', 'Whole Milk (1 gallon)', 'Hot Dogs (8-pack)']
+# Last day counted as training data in the train/test comparison
+TRAIN_END_DATE = '2024-08-31'
 
-df = pd.read_csv(SALES_FILE)
-
-# Check actual sales distributions
-print("\n=== SALES STATISTICS ===")
-for product in ['Organic Strawberries', 'Whole Milk (1 gallon)', 'Hot Dogs (8-pack)']:
-    product_df = df[df['product_name'] == product]
-    
-    print(f"\n{product}:")
-    print(f"  Daily sales - Mean: {product_df['quantity_sold'].mean():.1f}")
-    print(f"  Daily sales - Median: {product_df['quantity_sold'].median():.1f}")
-    print(f"  Daily sales - Min: {product_df['quantity_sold'].min()}")
-    print(f"  Daily sales - Max: {product_df['quantity_sold'].max()}")
-
-# Check for duplicate dates
-print("\n=== CHECKING FOR DUPLICATES ===")
-duplicates = df.groupby(['date', 'product_name']).size()
-dupes_found = duplicates[duplicates > 1]
-if len(dupes_found) > 0:
-    print("⚠️  DUPLICATES FOUND:")
-    print(dupes_found.head(10))
-else:
-    print("✓ No duplicates found")
-
-# Check train vs test distributions
-print("\n=== TRAIN VS TEST COMPARISON ===")
-df['date'] = pd.to_datetime(df['date'])
-for product in ['Organic Strawberries', 'Whole Milk (1 gallon)', 'Hot Dogs (8-pack)']:
-    product_df = df[df['product_name'] == product]
-    train = product_df[product_df['date'] <= '2024-08-31']
-    test = product_df[product_df['date'] > '2024-08-31']
-    
-    print(f"\n{product}:")
-    print(f"  Train avg: {train['quantity_sold'].mean():.1f} units/day")
-    print(f"  Test avg: {test['quantity_sold'].mean():.1f} units/day")
-    print(f"  Difference: {((test['quantity_sold'].mean() - train['quantity_sold'].mean()) / train['quantity_sold'].mean() * 100):.1f}%")
+
+def main():
+    """Print sales distribution, duplicate and train/test checks for the raw dataset"""
+    # Only the columns the checks use, with dates parsed during the read
+    df = pd.read_csv(
+        SALES_FILE,
+        usecols=['date', 'product_name', 'quantity_sold'],
+        parse_dates=['date'],
+        date_format='%Y-%m-%d',
+        dtype={'product_name': 'category'}
+    )
+    # Product comparisons on the categorical column are integer code compares
+    compared = df[df['product_name'].isin(PRODUCTS)]
+
+    # Check actual sales distributions
+    print("\n=== SALES STATISTICS ===")
+    stats = compared.groupby('product_name', observed=True)['quantity_sold'].agg(['mean', 'median', 'min', 'max'])
+    for product in PRODUCTS:
+        print(f"\n{product}:")
+        print(f"  Daily sales - Mean: {stats.at[product, 'mean']:.1f}")
+        print(f"  Daily sales - Median: {stats.at[product, 'median']:.1f}")
+        print(f"  Daily sales - Min: {stats.at[product, 'min']}")
+        print(f"  Daily sales - Max: {stats.at[product, 'max']}")
+
+    # Check for duplicate dates
+    print("\n=== CHECKING FOR DUPLICATES ===")
+    duplicates = df.groupby(['date', 'product_name'], observed=True).size()
+    dupes_found = duplicates[duplicates > 1]
+    if len(dupes_found) > 0:
+        print("⚠️  DUPLICATES FOUND:")
+        print(dupes_found.head(10))
+    else:
+        print("✓ No duplicates found")
+
+    # Check train vs test distributions
+    print("\n=== TRAIN VS TEST COMPARISON ===")
+    # One grouped pass gives every product's train (True) and test (False) average
+    is_train = (compared['date'] <= TRAIN_END_DATE).rename('is_train')
+    split_means = compared.groupby(['product_name', is_train], observed=True)['quantity_sold'].mean()
+    for product in PRODUCTS:
+        train_mean = split_means.get((product, True), float('nan'))
+        test_mean = split_means.get((product, False), float('nan'))
+
+        print(f"\n{product}:")
+        print(f"  Train avg: {train_mean:.1f} units/day")
+        print(f"  Test avg: {test_mean:.1f} units/day")
+        print(f"  Difference: {((test_mean - train_mean) / train_mean * 100):.1f}%")
+
+if __name__ == "__main__":
+    main()
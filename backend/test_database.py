@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Check that the batched Database methods agree with their per-product versions
+"""
+
+import numpy as np
+from database import Database, calculate_discounts, generate_mock_weather_data
+
+def reference_discount(waste_rate, performance):
+    """Per-product discount decision the vectorized calculate_discounts replaces"""
+    needs_discount = waste_rate > 15 or performance < 70
+    if not needs_discount:
+        return False, 0, "none"
+    if waste_rate > 25:
+        return True, 30, "high"
+    if waste_rate > 15:
+        return True, 20, "medium"
+    return True, 15, "low"
+
+def test_calculate_discounts_matches_reference():
+    """Vectorized tiers match the scalar rules, including the tier boundaries"""
+    waste_rates = np.array([0, 10, 15, 15.1, 20, 25, 25.1, 40, 5, 15, 30], dtype=np.float64)
+    performances = np.array([100, 80, 70, 90, 100, 100, 100, 100, 69.9, 50, 10], dtype=np.float64)
+
+    needs, discounts, urgencies = calculate_discounts(waste_rates, performances)
+
+    for i, (waste_rate, performance) in enumerate(zip(waste_rates, performances)):
+        expected = reference_discount(waste_rate, performance)
+        assert (bool(needs[i]), int(discounts[i]), str(urgencies[i])) == expected, (waste_rate, performance)
+
+def test_discount_recommendation_many_matches_single():
+    """Batch recommendations equal one get_discount_recommendation call per product"""
+    db = Database()
+    # Pin the weather so both paths forecast from the same inputs
+    weather = (generate_mock_weather_data(1), "Mock Data (test)")
+    db._fetch_weather = lambda days_ahead: weather
+    products = db.get_all_products() + ["Unknown Product"]
+
+    batch = db.get_discount_recommendation_many(products)
+
+    assert list(batch) == products
+    for product in products:
+        assert batch[product] == db.get_discount_recommendation(product), product
+
+def without_bounds(prediction):
+    """Forecast minus its sampled uncertainty interval, which varies between predict calls"""
+    return {
+        **prediction,
+        "predictions": [
+            {key: value for key, value in day.items() if key not in ("lower_bound", "upper_bound")}
+            for day in prediction["predictions"]
+        ]
+    }
+
+def test_prophet_prediction_many_matches_single():
+    """Batch forecasts equal repeated get_prophet_prediction calls with the same weather"""
+    db = Database()
+    days_ahead = 7
+    weather = (generate_mock_weather_data(days_ahead), "Mock Data (test)")
+    db._fetch_weather = lambda days_ahead: weather
+    products = db.get_all_products()
+
+    batch = db.get_prophet_prediction_many(products, days_ahead)
+    # Forecasts are cached per product and day, so the single calls must recompute
+    db.clear_cache()
+
+    assert list(batch) == products
+    for product in products:
+        single = db.get_prophet_prediction(product, days_ahead)
+        assert "error" not in single, single
+        assert without_bounds(batch[product]) == without_bounds(single), product
+
+if __name__ == "__main__":
+    test_calculate_discounts_matches_reference()
+    test_discount_recommendation_many_matches_single()
+    test_prophet_prediction_many_matches_single()
+    print("Database batch tests passed")
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Check that chat sessions expire when idle and the oldest are evicted when full
+"""
+
+import time
+from session_store import SessionStore
+
+def test_idle_sessions_expire():
+    """A session not touched within the TTL is gone"""
+    store = SessionStore(ttl=0.1, max_sessions=10)
+    store.set("a", {"history": []})
+    assert store.get("a") == {"history": []}
+
+    time.sleep(0.15)
+
+    assert store.get("a") is None
+    assert store.get("a", {}) == {}
+    assert len(store) == 0
+
+def test_least_recently_used_session_is_evicted():
+    """Beyond max_sessions, the session used longest ago is dropped first"""
+    store = SessionStore(ttl=60, max_sessions=2)
+    store.set("a", {"n": 1})
+    store.set("b", {"n": 2})
+    # Reading "a" makes "b" the least recently used
+    store.get("a")
+    store.set("c", {"n": 3})
+
+    assert len(store) == 2
+    assert store.get("b") is None
+    assert store.get("a") == {"n": 1}
+    assert store.get("c") == {"n": 3}
+
+if __name__ == "__main__":
+    test_idle_sessions_expire()
+    test_least_recently_used_session_is_evicted()
+    print("Session store tests passed")
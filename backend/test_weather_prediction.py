@@ -4,7 +4,7 @@ Simple test to verify Prophet models can take weather data for predictions
 """
 
 import pandas as pd
-import pickle
+import joblib
 import os
 from datetime import datetime, timedelta
 from weather_service import WeatherService
@@ -25,8 +25,7 @@ def test_weather_predictions():
                     print(f"  - {f}")
         return
     
-    with open(model_path, 'rb') as f:
-        model = pickle.load(f)
+    model = joblib.load(model_path, mmap_mode='r')
     
     print(f"Loaded model: {model_path}")
     
@@ -38,22 +37,27 @@ def test_weather_predictions():
     
     # Simple weather scenarios for 7 days
     weather_service = WeatherService()
-    weather_data = weather_service.get_forecast(7)
+    weather = weather_service.get_forecast_arrays(7)
 
     # Create future dataframe with weather
+    is_weekend = (future_dates.dayofweek >= 5).astype(int)
     future = pd.DataFrame({
         'ds': future_dates,
-        'temperature': [w['temperature'] for w in weather_data],
-        'precipitation': [w['precipitation'] for w in weather_data],
-        'is_weekend': [1 if d.dayofweek >= 5 else 0 for d in future_dates],
+        'temperature': weather['temperature'],
+        'precipitation': weather['precipitation'],
+        'is_weekend': is_weekend,
         'is_holiday': [0] * 7
     })
+    # Print from the raw dates and weather dicts rather than iterating DataFrame rows
+    date_strings = future_dates.strftime('%Y-%m-%d')
+    weekend_labels = [" (Weekend)" if weekend else "" for weekend in is_weekend]
+    temperatures = weather['temperature'].tolist()
     
     print("\nFuture weather data:")
-    for i, row in future.iterrows():
-        weather = weather_data[i]
-        weekend = " (Weekend)" if row['is_weekend'] else ""
-        print(f"  {row['ds'].strftime('%Y-%m-%d')}: {weather['temperature']}°F, {weather['precipitation']}\" rain{weekend}")
+    for date_str, temperature, precipitation, weekend in zip(
+        date_strings, temperatures, weather['precipitation'].tolist(), weekend_labels
+    ):
+        print(f"  {date_str}: {temperature}°F, {precipitation}\" rain{weekend}")
     
     # Try to make predictions
     try:
@@ -62,14 +66,17 @@ def test_weather_predictions():
         
         print("\nPredictions with weather impact:")
         print("=" * 70)
-        for i, row in forecast.iterrows():
-            weather = weather_data[i]
-            future_row = future.iloc[i]
-            weekend = " (Weekend)" if future_row['is_weekend'] else ""
-            
-            print(f"{future_row['ds'].strftime('%Y-%m-%d')}: {row['yhat']:.1f} units "
-                  f"({row['yhat_lower']:.1f}-{row['yhat_upper']:.1f}) | "
-                  f"{weather['temperature']}°F{weekend}")
+        for date_str, yhat, lower, upper, temperature, weekend in zip(
+            date_strings,
+            forecast['yhat'].to_numpy(),
+            forecast['yhat_lower'].to_numpy(),
+            forecast['yhat_upper'].to_numpy(),
+            temperatures,
+            weekend_labels
+        ):
+            print(f"{date_str}: {yhat:.1f} units "
+                  f"({lower:.1f}-{upper:.1f}) | "
+                  f"{temperature}°F{weekend}")
         
         print(f"\nSUCCESS! Model predictions work with weather data.")
         print(f"Average prediction: {forecast['yhat'].mean():.1f} units")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Check that concurrent forecast cache misses share a single weather API call
+"""
+
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+import weather_service
+from weather_service import WeatherService
+
+THREADS = 8
+
+@contextmanager
+def isolated_disk_cache():
+    """Point the forecast disk cache at an empty temporary directory"""
+    original = weather_service.FORECAST_CACHE_DIR
+    with tempfile.TemporaryDirectory() as cache_dir:
+        weather_service.FORECAST_CACHE_DIR = cache_dir
+        try:
+            yield
+        finally:
+            weather_service.FORECAST_CACHE_DIR = original
+
+def fetch_concurrently(service, days=7):
+    """Call get_forecast from THREADS threads released at once and return their results"""
+    start = threading.Barrier(THREADS)
+    results = [None] * THREADS
+
+    def worker(i):
+        start.wait()
+        results[i] = service.get_forecast(days)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrent_misses_make_one_api_call():
+    """Threads missing the cache together wait for the first fetch instead of each calling the API"""
+    with isolated_disk_cache():
+        service = WeatherService()
+        real_fetch = service._generate_mock_forecast
+        calls = []
+
+        def slow_fetch(days, now=None):
+            calls.append(days)
+            time.sleep(0.2)
+            return real_fetch(days, now)
+
+        service._fetch_from_api = slow_fetch
+        results = fetch_concurrently(service)
+
+    assert len(calls) == 1, calls
+    assert all(result == results[0] for result in results)
+
+def test_failed_fetch_is_not_retried_by_waiters():
+    """When the shared fetch fails, waiters fall back to mock data without calling the API themselves"""
+    with isolated_disk_cache():
+        service = WeatherService()
+        calls = []
+
+        def failing_fetch(days, now=None):
+            calls.append(days)
+            time.sleep(0.2)
+            raise ConnectionError("API unavailable")
+
+        service._fetch_from_api = failing_fetch
+        results = fetch_concurrently(service)
+
+    assert len(calls) == 1, calls
+    assert all(len(result) == 7 for result in results)
+
+if __name__ == "__main__":
+    test_concurrent_misses_make_one_api_call()
+    test_failed_fetch_is_not_retried_by_waiters()
+    print("Weather service tests passed")
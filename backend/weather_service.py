@@ -5,13 +5,50 @@ Fetches real weather forecasts for Cambridge, Boston
 
 import requests
 import os
-import json
+import orjson
+import threading
+import time
+import numpy as np
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
-from dotenv import load_dotenv
+from urllib.parse import urlencode
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-# Load environment variables
-load_dotenv()
+# Load environment variables from .env in development; deployments (APP_ENV != dev) set them directly
+if os.getenv('APP_ENV', 'dev') == 'dev':
+    from dotenv import load_dotenv
+    load_dotenv()
+
+# How long (seconds) an API forecast is reused before fetching again; WEATHER_CACHE_TTL overrides it
+FORECAST_CACHE_TIMEOUT = int(os.getenv('WEATHER_CACHE_TTL', '600'))
+# API forecasts are also persisted here so fresh processes can reuse them
+FORECAST_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.weather_cache')
+
+# Keep-alive pool and retries for OpenWeather; transient errors are retried before falling back to mock data
+HTTP_POOL_MAXSIZE = 10
+HTTP_MAX_RETRIES = 2
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Responses meaning the key can never use this endpoint (e.g. free-tier keys on forecast/daily)
+HTTP_REJECTED_STATUSES = (401, 403)
+
+# Description tiers: temperature (°F) and precipitation (inches) lower bounds, with the label for each band
+TEMP_DESCRIPTION_BOUNDS = np.array([45, 60, 70, 80])
+TEMP_DESCRIPTION_LABELS = ["Cold", "Cool", "Mild", "Warm", "Hot"]
+PRECIP_DESCRIPTION_BOUNDS = np.array([0.1, 0.3, 1.0])
+# Dry labels, then rain and snow labels by precipitation tier (light, moderate, heavy)
+WEATHER_DESCRIPTION_LABELS = ["Clear", "Cloudy", "Light Rain", "Rainy", "Heavy Rain", "Light Snow", "Snowy", "Heavy Snow"]
+# Condition codes for describing weather: 0 other, 1 rain, 2 cloudy (unlisted conditions are 0)
+WEATHER_MAIN_CODES = {"Rain": 1, "Clouds": 2, "Overcast": 2}
+# Per condition code: first wet label (precipitation reads as rain only for rain, otherwise snow),
+# and the label when there is no precipitation
+WET_LABEL_OFFSETS = np.array([4, 1, 4])
+DRY_LABELS = np.array([0, 0, 1])
+# Every "<temperature> and <weather>" description, built once and indexed by (temperature tier, weather label)
+WEATHER_DESCRIPTIONS = np.array([
+    [f"{temp_desc} and {weather_desc}" for weather_desc in WEATHER_DESCRIPTION_LABELS]
+    for temp_desc in TEMP_DESCRIPTION_LABELS
+], dtype=object)
 
 class WeatherService:
     """Service for fetching real weather data from OpenWeather API"""
@@ -24,6 +61,28 @@ class WeatherService:
         self.lat = 42.3736
         self.lon = -71.1097
         
+        # Location, key and units never change, so their query string is encoded once; only cnt varies
+        self._forecast_url = f"{self.base_url}?" + urlencode({
+            'lat': self.lat,
+            'lon': self.lon,
+            'appid': self.api_key or '',
+            'units': 'imperial'  # Fahrenheit and mph
+        })
+        
+        self._cache = {}
+        self._cache_timeout = FORECAST_CACHE_TIMEOUT
+        self._cache_lock = threading.Lock()
+        # Cache key -> Event set when the in-flight fetch for that key finishes
+        self._inflight = {}
+        # HTTP status once the API rejects the key, so later calls go straight to mock data
+        self._api_rejected = None
+        # Keep-alive session so repeat fetches skip the TCP/DNS setup
+        self._session = requests.Session()
+        retries = Retry(total=HTTP_MAX_RETRIES, backoff_factor=0.3, status_forcelist=HTTP_RETRY_STATUSES)
+        adapter = HTTPAdapter(pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retries)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        
         if not self.api_key:
             print("Warning: OPENWEATHER_API_KEY not found in environment variables")
     
@@ -31,76 +90,124 @@ class WeatherService:
         """
         Get weather forecast for the specified number of days.
         Falls back to mock data when API key is not available.
+        API results are cached per day so one call serves every product.
         """
+        # One clock read serves the cache key, freshness check, timestamps and forecast dates
+        now = datetime.now()
+        cache_key = f"forecast_{self.lat}_{self.lon}_{days}_{now.date()}"
+        with self._cache_lock:
+            if self._is_cache_valid(cache_key, now):
+                return list(self._cache[cache_key]['data'])
+            # Concurrent misses for the same key (e.g. per-product forecasts fanned out on
+            # threads) wait for the first caller's fetch; other horizons proceed independently
+            fetch_done = self._inflight.get(cache_key)
+            is_owner = fetch_done is None
+            if is_owner:
+                fetch_done = self._inflight[cache_key] = threading.Event()
+        
+        if not is_owner:
+            fetch_done.wait()
+            with self._cache_lock:
+                if self._is_cache_valid(cache_key, now):
+                    return list(self._cache[cache_key]['data'])
+            # The owning fetch failed and fell back to mock data; do the same
+            return self._generate_mock_forecast(days, now)
+        
         try:
-            # API call temporarily commented out - uncomment when API key is ready            
-            return self._fetch_from_api(days)
-        except Exception as e:
-            print(f"Error fetching weather forecast: {e}")
-            return self._generate_mock_forecast(days)
+            forecast = self._load_disk_cache(cache_key)
+            if forecast is not None:
+                with self._cache_lock:
+                    self._cache[cache_key] = {'data': forecast, 'timestamp': now}
+                return list(forecast)
+            
+            try:
+                # API call temporarily commented out - uncomment when API key is ready            
+                forecast = self._fetch_from_api(days, now)
+                with self._cache_lock:
+                    self._cache[cache_key] = {'data': forecast, 'timestamp': now}
+                self._save_disk_cache(cache_key, forecast)
+                return list(forecast)
+            except Exception as e:
+                if isinstance(e, requests.HTTPError) and e.response.status_code in HTTP_REJECTED_STATUSES:
+                    self._api_rejected = e.response.status_code
+                print(f"Error fetching weather forecast: {e}")
+                return self._generate_mock_forecast(days, now)
+        finally:
+            with self._cache_lock:
+                del self._inflight[cache_key]
+            fetch_done.set()
     
-    def _fetch_from_api(self, days: int) -> List[Dict]:
+    def get_forecast_arrays(self, days=7) -> Dict[str, np.ndarray]:
+        """Same forecast as get_forecast, as one array per field (conditions as integer codes) for vectorized consumers"""
+        forecast = self.get_forecast(days)
+        return {
+            'temperature': np.array([day['temperature'] for day in forecast], dtype=np.float64),
+            'precipitation': np.array([day['precipitation'] for day in forecast], dtype=np.float64),
+            'humidity': np.array([day['humidity'] for day in forecast], dtype=np.int16),
+            'pressure': np.array([day['pressure'] for day in forecast], dtype=np.int16),
+            'date': np.array([day['date'] for day in forecast], dtype='datetime64[us]'),
+            # Condition per day as a WEATHER_MAIN_CODES code (0 other, 1 rain, 2 cloudy)
+            'weather_code': np.array(
+                [WEATHER_MAIN_CODES.get(day['weather_main'], 0) for day in forecast], dtype=np.int8
+            )
+        }
+    
+    def _fetch_from_api(self, days: int, now: Optional[datetime] = None) -> List[Dict]:
         """Fetch weather data from OpenWeather API"""
         
         if not self.api_key:
             raise Exception("OpenWeather API key not configured")
+        if self._api_rejected:
+            raise Exception(f"OpenWeather API rejected the key earlier (HTTP {self._api_rejected})")
         
-        # API parameters
-        params = {
-            'lat': self.lat,
-            'lon': self.lon,
-            'cnt': min(days, 16),  # API supports max 16 days
-            'appid': self.api_key,
-            'units': 'imperial'  # Fahrenheit and mph
-        }
-        
-        # Make API request
-        response = requests.get(self.base_url, params=params, timeout=10)
+        # Make API request (API supports max 16 days)
+        response = self._session.get(f"{self._forecast_url}&cnt={min(days, 16)}", timeout=10)
         response.raise_for_status()
         
-        data = response.json()
+        data = orjson.loads(response.content)
         
         # Transform to our format
-        return self._transform_api_response(data, days)
+        return self._transform_api_response(data, days, now)
     
-    def _transform_api_response(self, api_data: Dict, requested_days: int) -> List[Dict]:
+    def _transform_api_response(self, api_data: Dict, requested_days: int, now: Optional[datetime] = None) -> List[Dict]:
         """Transform OpenWeather API response to our mock weather format"""
+        now = now or datetime.now()
+        
+        days_data = api_data.get('list', [])[:requested_days]
+        
+        # Read each day's fields in one pass; the numeric ones are converted below as arrays
+        temps_kelvin = []
+        precipitations_mm = []
+        weather_mains = []
+        weather_descs = []
+        for day_data in days_data:
+            # Day temperature in Kelvin, falling back to the max; default ~60°F
+            temp_data = day_data.get('temp', {})
+            temps_kelvin.append(temp_data.get('day', temp_data.get('max', 288)))
+            # Rain and snow in mm; either may be missing
+            precipitations_mm.append(day_data.get('rain', 0.0) + day_data.get('snow', 0.0))
+            # Weather condition and its API description
+            weather = (day_data.get('weather') or ({},))[0]
+            weather_mains.append(weather.get('main', 'Clear'))
+            weather_descs.append(weather.get('description', 'clear sky'))
+        
+        # Kelvin to Fahrenheit and mm to inches for every day at once
+        temperatures = (np.array(temps_kelvin, dtype=np.float64) - 273.15) * 9/5 + 32
+        precipitations = np.array(precipitations_mm, dtype=np.float64) / 25.4
+        
+        # Generate our descriptions
+        descriptions = self._describe_weather(weather_mains, temperatures, precipitations)
         
         forecast_list = []
         
         # Process daily forecasts
-        for i, day_data in enumerate(api_data.get('list', [])[:requested_days]):
-            
-            # Extract temperature (day temp) and convert Kelvin to Fahrenheit
-            temp_data = day_data.get('temp', {})
-            temp_kelvin = temp_data.get('day', temp_data.get('max', 288))  # Default ~60°F in Kelvin
-            temperature = (temp_kelvin - 273.15) * 9/5 + 32  # K to F conversion
-            
-            # Extract precipitation (rain + snow in mm, convert to inches)
-            precipitation_mm = 0.0
-            
-            # Rain field (may not exist)
-            if 'rain' in day_data:
-                precipitation_mm += day_data['rain']
-            
-            # Snow field (may not exist) 
-            if 'snow' in day_data:
-                precipitation_mm += day_data['snow']
-            
-            # Convert mm to inches
-            precipitation_inches = precipitation_mm / 25.4
-            
-            # Extract weather description
-            weather_list = day_data.get('weather', [{}])
-            weather_main = weather_list[0].get('main', 'Clear') if weather_list else 'Clear'
-            weather_desc = weather_list[0].get('description', 'clear sky') if weather_list else 'clear sky'
-            
-            # Generate our description
-            description = self._get_weather_description(weather_main, temperature, precipitation_inches)
-            
+        for i, day_data, temperature, precipitation_inches, weather_main, weather_desc, description in zip(
+            range(len(days_data)), days_data, temperatures.tolist(), precipitations.tolist(),
+            weather_mains, weather_descs, descriptions
+        ):
             # Convert timestamp to date
             timestamp = day_data.get('dt', 0)
-            forecast_date = datetime.fromtimestamp(timestamp) if timestamp else datetime.now() + timedelta(days=i+1)
+            forecast_date = datetime.fromtimestamp(timestamp) if timestamp else now + timedelta(days=i+1)
             
             forecast_list.append({
                 "day": i + 1,
@@ -118,67 +225,51 @@ class WeatherService:
     
     def _get_weather_description(self, weather_main: str, temp: float, precip: float) -> str:
         """Generate human-readable weather description"""
+        return self._describe_weather([weather_main], np.array([temp]), np.array([precip]))[0]
+    
+    @staticmethod
+    def _describe_weather(weather_mains: List[str], temps: np.ndarray, precips: np.ndarray) -> List[str]:
+        """Human-readable descriptions for many days, via table lookups instead of an if/elif ladder"""
+        temp_tiers = np.searchsorted(TEMP_DESCRIPTION_BOUNDS, temps, side='right')
+        precip_levels = np.searchsorted(PRECIP_DESCRIPTION_BOUNDS, precips, side='right')
         
-        # Temperature categories
-        if temp >= 80:
-            temp_desc = "Hot"
-        elif temp >= 70:
-            temp_desc = "Warm"
-        elif temp >= 60:
-            temp_desc = "Mild"
-        elif temp >= 45:
-            temp_desc = "Cool"
-        else:
-            temp_desc = "Cold"
-        
-        # Precipitation categories
-        if precip >= 1.0:
-            weather_desc = "Heavy Rain" if weather_main == "Rain" else "Heavy Snow"
-        elif precip >= 0.3:
-            weather_desc = "Rainy" if weather_main == "Rain" else "Snowy"
-        elif precip >= 0.1:
-            weather_desc = "Light Rain" if weather_main == "Rain" else "Light Snow"
-        elif weather_main in ["Clouds", "Overcast"]:
-            weather_desc = "Cloudy"
-        else:
-            weather_desc = "Clear"
-        
-        return f"{temp_desc} and {weather_desc}"
+        codes = np.array([WEATHER_MAIN_CODES.get(weather_main, 0) for weather_main in weather_mains], dtype=np.intp)
+        weather_labels = np.where(precip_levels > 0, WET_LABEL_OFFSETS[codes] + precip_levels, DRY_LABELS[codes])
+        
+        return WEATHER_DESCRIPTIONS[temp_tiers, weather_labels].tolist()
     
-    def _generate_mock_forecast(self, days: int) -> List[Dict]:
+    def _generate_mock_forecast(self, days: int, now: Optional[datetime] = None) -> List[Dict]:
         """Generate mock weather forecast data"""
-        import random
+        # Draw every day's random values in a few array calls instead of per-day random() calls
+        rng = np.random.default_rng()
+        
+        # Generate realistic seasonal temperatures for Boston in October
+        base_temp = 65  # Average October temp in Boston
+        temperatures = base_temp + rng.uniform(-15, 15, days)
+        
+        # Generate precipitation (0-2 inches, with bias toward lower amounts)
+        has_precipitation = rng.random(days) < 0.3  # 30% chance of precipitation
+        precipitations = np.where(has_precipitation, rng.uniform(0.1, 1.5, days), 0.0)
+        is_cloudy = rng.random(days) < 0.4
+        humidities = rng.integers(40, 80, days, endpoint=True)
+        pressures = rng.integers(1000, 1025, days, endpoint=True)
+        
+        # Generate weather condition from the drawn precipitation and cloud cover
+        weather_mains = np.select(
+            [precipitations > 0.5, precipitations > 0, is_cloudy], ["Rain", "Drizzle", "Clouds"], "Clear"
+        ).tolist()
+        weather_descs = np.select(
+            [precipitations > 0.5, precipitations > 0, is_cloudy], ["rainy", "light rain", "cloudy"], "clear sky"
+        ).tolist()
+        descriptions = self._describe_weather(weather_mains, temperatures, precipitations)
         
         forecast_list = []
-        base_date = datetime.now()
+        base_date = now or datetime.now()
         
-        for i in range(days):
-            # Generate realistic seasonal temperatures for Boston in October
-            base_temp = 65  # Average October temp in Boston
-            temp_variation = random.uniform(-15, 15)
-            temperature = base_temp + temp_variation
-            
-            # Generate precipitation (0-2 inches, with bias toward lower amounts)
-            if random.random() < 0.3:  # 30% chance of precipitation
-                precipitation = random.uniform(0.1, 1.5)
-            else:
-                precipitation = 0.0
-            
-            # Generate weather description
-            if precipitation > 0.5:
-                weather_main = "Rain"
-                weather_desc = "rainy"
-            elif precipitation > 0:
-                weather_main = "Drizzle" 
-                weather_desc = "light rain"
-            elif random.random() < 0.4:
-                weather_main = "Clouds"
-                weather_desc = "cloudy"
-            else:
-                weather_main = "Clear"
-                weather_desc = "clear sky"
-            
-            description = self._get_weather_description(weather_main, temperature, precipitation)
+        for i, temperature, precipitation, weather_main, weather_desc, description, humidity, pressure in zip(
+            range(days), temperatures.tolist(), precipitations.tolist(), weather_mains,
+            weather_descs, descriptions, humidities.tolist(), pressures.tolist()
+        ):
             forecast_date = base_date + timedelta(days=i+1)
             
             forecast_list.append({
@@ -189,23 +280,76 @@ class WeatherService:
                 "date": forecast_date,
                 "weather_main": weather_main,
                 "weather_description": weather_desc,
-                "humidity": random.randint(40, 80),
-                "pressure": random.randint(1000, 1025)
+                "humidity": humidity,
+                "pressure": pressure
             })
         
         return forecast_list
     
-    def _is_cache_valid(self, cache_key: str) -> bool:
+    def _is_cache_valid(self, cache_key: str, now: Optional[datetime] = None) -> bool:
         """Check if cached data is still valid"""
         if cache_key not in self._cache:
             return False
         
         cached_time = self._cache[cache_key]['timestamp']
-        return (datetime.now() - cached_time).seconds < self._cache_timeout
+        return ((now or datetime.now()) - cached_time).total_seconds() < self._cache_timeout
+    
+    def _disk_cache_path(self, cache_key: str) -> str:
+        """Path of the on-disk copy of a cached forecast"""
+        return os.path.join(FORECAST_CACHE_DIR, f"{cache_key}.json")
+    
+    def _load_disk_cache(self, cache_key: str) -> Optional[List[Dict]]:
+        """Return a forecast persisted by any process within the cache timeout, or None"""
+        path = self._disk_cache_path(cache_key)
+        try:
+            if time.time() - os.path.getmtime(path) >= self._cache_timeout:
+                return None
+            with open(path, 'rb') as f:
+                forecast = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+        for day in forecast:
+            day['date'] = datetime.fromisoformat(day['date'])
+        return forecast
+    
+    def _save_disk_cache(self, cache_key: str, forecast: List[Dict]):
+        """Persist an API forecast; failures only cost the cross-process reuse"""
+        path = self._disk_cache_path(cache_key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(FORECAST_CACHE_DIR, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(orjson.dumps(forecast))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not persist weather cache: {e}")
+            return
+        self._prune_disk_cache()
+    
+    def _prune_disk_cache(self):
+        """Delete persisted forecasts (and abandoned tmp files) older than the cache timeout"""
+        cutoff = time.time() - self._cache_timeout
+        try:
+            with os.scandir(FORECAST_CACHE_DIR) as entries:
+                for entry in entries:
+                    try:
+                        if entry.stat().st_mtime < cutoff:
+                            os.remove(entry.path)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
     
     def clear_cache(self):
         """Clear the weather cache"""
-        self._cache = {}
+        with self._cache_lock:
+            self._cache = {}
+        if os.path.isdir(FORECAST_CACHE_DIR):
+            for name in os.listdir(FORECAST_CACHE_DIR):
+                try:
+                    os.remove(os.path.join(FORECAST_CACHE_DIR, name))
+                except OSError:
+                    pass
         print("Weather cache cleared")
 
 # Global instance